@@ -0,0 +1,285 @@
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+from pathlib import Path
+import PIL
+from PIL import Image, TiffImagePlugin
+
+from labelreviewer import (COCOIndex, ImagePyramid, compute_crop_box, decode_crop,
+                           extract_category_crops, load_instance_image,
+                           write_rejected_set, rejected_set_path, THUMBNAIL_SIZE)
+
+
+# Pillow only exposes per-strip tiles for uncompressed TIFFs, and its own
+# writer puts the whole image in one strip, so the TIFF source is written
+# through libtiff in 64 KB strips.
+DECODE_FORMATS = {
+    'jpeg': ('.jpg', {'quality': 90}),
+    'png': ('.png', {}),
+    'tiff': ('.tif', {'strip_size': 64 * 1024}),
+}
+
+
+def time_call(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def make_source_image(path, width, height, save_options):
+    # Noise compresses poorly, which keeps decode times representative of
+    # real photos rather than of flat test patterns.
+    img = Image.effect_noise((width, height), 64).convert('RGB')
+    write_libtiff = TiffImagePlugin.WRITE_LIBTIFF
+    TiffImagePlugin.WRITE_LIBTIFF = path.suffix == '.tif'
+    try:
+        img.save(path, **save_options)
+    except (TypeError, ValueError, OSError):
+        img.save(path)
+    finally:
+        TiffImagePlugin.WRITE_LIBTIFF = write_libtiff
+
+
+def random_bboxes(width, height, count, min_size, max_size, rng):
+    bboxes = []
+    for _ in range(count):
+        w = rng.uniform(min_size, max_size)
+        h = rng.uniform(min_size, max_size)
+        bboxes.append([rng.uniform(0, width - w), rng.uniform(0, height - h), w, h])
+    return bboxes
+
+
+def baseline_crop(path, bbox, max_size=None):
+    img = Image.open(path)
+    cropped = img.crop(compute_crop_box(bbox, img.width, img.height))
+    if max_size is not None:
+        cropped.thumbnail((max_size, max_size))
+    return cropped
+
+
+def bench_decode(width, height, repeat, bbox_size, formats, workdir):
+    rng = random.Random(0)
+    bboxes = random_bboxes(width, height, repeat, bbox_size / 2, bbox_size, rng)
+    results = []
+    
+    for name in formats:
+        suffix, save_options = DECODE_FORMATS[name]
+        path = Path(workdir) / f'source_{width}x{height}{suffix}'
+        make_source_image(path, width, height, save_options)
+        with Image.open(path) as img:
+            if img.format == 'TIFF' and len(img.tile) <= 1:
+                print(f"Skipping {name}: {path.name} was written as a single strip, "
+                      f"so there are no tiles to skip")
+                continue
+        
+        for label, max_size in (('full', None), ('thumbnail', THUMBNAIL_SIZE)):
+            boxes = iter(bboxes * 2)
+            baseline_ms = time_call(lambda: baseline_crop(path, next(boxes), max_size), repeat)
+            boxes = iter(bboxes * 2)
+            fast_ms = time_call(lambda: decode_crop(path, next(boxes), max_size), repeat)
+            
+            results.append({
+                'format': name,
+                'mode': label,
+                'baseline_ms': baseline_ms,
+                'decode_crop_ms': fast_ms,
+                'speedup': baseline_ms / fast_ms if fast_ms else float('inf')
+            })
+    
+    return results
+
+
+def print_decode_results(results):
+    print(f"{'format':<8}{'mode':<12}{'open+crop':>12}{'decode_crop':>14}{'speedup':>10}")
+    for result in results:
+        print(f"{result['format']:<8}{result['mode']:<12}"
+              f"{result['baseline_ms']:>10.2f}ms{result['decode_crop_ms']:>12.2f}ms"
+              f"{result['speedup']:>9.1f}x")
+
+
+def make_dataset(workdir, num_images, num_annotations, num_categories, width, height,
+                 seed=0):
+    rng = random.Random(seed)
+    workdir = Path(workdir)
+    images_dir = workdir / 'images'
+    images_dir.mkdir(parents=True, exist_ok=True)
+    
+    # One shared source frame keeps dataset generation fast; every image
+    # entry points at its own copy on disk so file-system costs stay real.
+    source = Image.effect_noise((width, height), 64).convert('RGB')
+    images = []
+    for image_id in range(1, num_images + 1):
+        file_name = f'{image_id:08d}.jpg'
+        source.save(images_dir / file_name, quality=90)
+        images.append({'id': image_id, 'file_name': file_name,
+                       'width': width, 'height': height})
+    
+    categories = [{'id': cat_id, 'name': f'category_{cat_id}'}
+                  for cat_id in range(1, num_categories + 1)]
+    
+    annotations = []
+    for ann_id in range(1, num_annotations + 1):
+        w = rng.uniform(8, width / 4)
+        h = rng.uniform(8, height / 4)
+        annotations.append({
+            'id': ann_id,
+            'image_id': rng.randint(1, num_images),
+            'category_id': rng.randint(1, num_categories),
+            'bbox': [rng.uniform(0, width - w), rng.uniform(0, height - h), w, h],
+            'area': w * h,
+            'iscrowd': 0
+        })
+    
+    coco_path = workdir / 'annotations.json'
+    with open(coco_path, 'w') as f:
+        json.dump({'images': images, 'annotations': annotations,
+                   'categories': categories}, f)
+    
+    return coco_path, images_dir
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def bench_suite(args, workdir):
+    workdir = Path(workdir)
+    width, height = args.resolution
+    coco_path, images_dir = make_dataset(workdir, args.images, args.annotations,
+                                         args.categories, width, height)
+    results = {}
+    
+    coco_index, results['json_load_ms'] = timed(lambda: COCOIndex.load(coco_path))
+    
+    _, results['category_count_ms'] = timed(
+        lambda: [coco_index.category_count(cat['id']) for cat in coco_index.categories])
+    
+    category = max(coco_index.categories, key=lambda cat: coco_index.category_count(cat['id']))
+    results['category'] = category['name']
+    results['category_instances'] = coco_index.category_count(category['id'])
+    
+    instances, results['virtual_crop_ms'] = timed(
+        lambda: extract_category_crops(coco_index, category, images_dir,
+                                       output_root=workdir / 'output', write_crops=False))
+    
+    _, results['crop_extraction_ms'] = timed(
+        lambda: extract_category_crops(coco_index, category, images_dir,
+                                       output_root=workdir / 'output', workers=args.workers))
+    
+    _, results['crop_extraction_cached_ms'] = timed(
+        lambda: extract_category_crops(coco_index, category, images_dir,
+                                       output_root=workdir / 'output', workers=args.workers))
+    
+    # Display latency: decode, build the pyramid and render a fitted view, as
+    # load_current_instance + fit_to_window do, without needing a display.
+    canvas_width, canvas_height = 1200, 700
+    display_times = []
+    for instance in instances[:args.display_samples]:
+        start = time.perf_counter()
+        img = load_instance_image(instance)
+        img.load()
+        pyramid = ImagePyramid(img)
+        zoom = min(canvas_width / img.width, canvas_height / img.height) * 0.95
+        size = (max(1, int(img.width * zoom)), max(1, int(img.height * zoom)))
+        pyramid.render(zoom, (0, 0, img.width, img.height), size)
+        display_times.append((time.perf_counter() - start) * 1000)
+    display_times.sort()
+    if display_times:
+        results['display_p50_ms'] = display_times[len(display_times) // 2]
+        results['display_p95_ms'] = display_times[int(len(display_times) * 0.95)]
+    
+    rejected = [instance['annotation'] for instance in instances]
+    for export_format in args.export_formats:
+        output_path = rejected_set_path(workdir / 'output', category, export_format)
+        try:
+            _, results[f'export_{export_format}_ms'] = timed(
+                lambda: write_rejected_set(output_path, rejected, [category], coco_index,
+                                           export_format))
+        except RuntimeError as e:
+            print(f"Skipping {export_format} export: {e}")
+    
+    return results
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COCO Label Reviewer benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    decode_parser = subparsers.add_parser('decode', help="Compare decode_crop with open+crop")
+    decode_parser.add_argument('--size', type=parse_size, default=(3840, 2160),
+                               help="Source image size as WIDTHxHEIGHT (default: 3840x2160)")
+    # Boxes must be well above THUMBNAIL_SIZE for JPEG draft scaling to
+    # kick in on thumbnail decodes.
+    decode_parser.add_argument('--bbox-size', type=float, default=512,
+                               help="Largest bbox side in pixels (default: 512)")
+    decode_parser.add_argument('--repeat', type=int, default=20)
+    decode_parser.add_argument('--formats', nargs='+', choices=sorted(DECODE_FORMATS),
+                               default=sorted(DECODE_FORMATS))
+    
+    suite_parser = subparsers.add_parser('suite', help="Time load, crop, render and export")
+    suite_parser.add_argument('--images', type=int, default=200)
+    suite_parser.add_argument('--annotations', type=int, default=5000)
+    suite_parser.add_argument('--categories', type=int, default=10)
+    suite_parser.add_argument('--resolution', type=parse_size, default=(1920, 1080),
+                              help="Image size as WIDTHxHEIGHT (default: 1920x1080)")
+    suite_parser.add_argument('--workers', type=int, default=None)
+    suite_parser.add_argument('--display-samples', type=int, default=100)
+    suite_parser.add_argument('--export-formats', nargs='+', default=['json', 'json.gz'],
+                              choices=['json', 'json.gz', 'npz'])
+    
+    for subparser in (decode_parser, suite_parser):
+        subparser.add_argument('--output', type=Path,
+                               help="Write results as JSON to this file")
+    
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.command == 'decode':
+            width, height = args.size
+            results = bench_decode(width, height, args.repeat, args.bbox_size,
+                                   args.formats, workdir)
+            print_decode_results(results)
+        else:
+            results = bench_suite(args, workdir)
+            for name, value in results.items():
+                if isinstance(value, float):
+                    print(f"{name:<28}{value:>12.2f}")
+                else:
+                    print(f"{name:<28}{value:>12}")
+    
+    if args.output is not None:
+        parameters = {key: value for key, value in vars(args).items() if key != 'output'}
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': args.command, 'environment': environment_info(),
+                       'parameters': parameters, 'results': results}, f,
+                      indent=2, default=str)
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
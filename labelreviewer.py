@@ -1,11 +1,1801 @@
 import os
 import sys
 import json
+import argparse
+import gzip
+import hashlib
+import math
+import re
+import socket
+import zlib
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from pathlib import Path
-from PIL import Image, ImageTk, ImageDraw
+from PIL import Image, ImageTk
 import shutil
+import tempfile
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+CROP_PADDING = 10
+RENDER_MARGIN = 256
+THUMBNAIL_SIZE = 128
+GRID_COLUMNS = 10
+GRID_ROWS = 10
+CROP_FORMATS = {'png': '.png', 'png-fast': '.png', 'jpg': '.jpg'}
+EXPORT_FORMATS = {'json': '.json', 'json.gz': '.json.gz', 'npz': '.npz'}
+GZIP_LEVEL = 2
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+DECISION_CODES = {'accept': 1, 'reject': 2}
+
+TINY_BOX_AREA = 64
+EXTREME_ASPECT_RATIO = 8
+OVERLAP_IOU = 0.5
+DUPLICATE_IOU = 0.9
+SUSPICION_WEIGHTS = {
+    'degenerate': 5.0,
+    'duplicate': 4.0,
+    'out_of_bounds': 3.0,
+    'overlap': 2.0,
+    'tiny': 2.0,
+    'aspect': 1.5,
+    'crowd': 1.0,
+}
+
+
+class PerfStats:
+    # Rolling windows of recent timings per hot path, in milliseconds.
+    # Recording is cheap enough to leave on; percentiles are only computed
+    # when the overlay or a dump asks for them.
+    
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+    
+    def record(self, name, elapsed_ms):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+            samples.append(elapsed_ms)
+    
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+    
+    def summary(self):
+        with self.lock:
+            snapshot = {name: sorted(samples) for name, samples in self.samples.items()}
+        
+        result = {}
+        for name, samples in snapshot.items():
+            if not samples:
+                continue
+            result[name] = {
+                'count': len(samples),
+                'p50_ms': samples[len(samples) // 2],
+                'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                'max_ms': samples[-1]
+            }
+        return result
+    
+    def dump(self, path, extra=None):
+        data = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'timings': self.summary()}
+        if extra:
+            data.update(extra)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+perf = PerfStats()
+
+
+def compute_crop_box(bbox, img_width, img_height, padding=CROP_PADDING):
+    x, y, w, h = bbox
+    x1 = max(0, int(x - padding))
+    y1 = max(0, int(y - padding))
+    x2 = min(img_width, int(x + w + padding))
+    y2 = min(img_height, int(y + h + padding))
+    return (x1, y1, x2, y2)
+
+
+def group_positions_by_image(coco_index, category_ids):
+    groups = {}
+    image_ids = coco_index.annotation_image_ids
+    for category_id in category_ids:
+        for position in coco_index.category_index.get(category_id, ()):
+            groups.setdefault(image_ids[position], array('q')).append(position)
+    return groups
+
+
+def find_source_image(image_info, images_dir, dir_index=None):
+    image_path = Path(images_dir) / image_info['file_name']
+    if dir_index is not None:
+        found = dir_index.exists(image_info['file_name'])
+    else:
+        found = image_path.exists()
+    return image_path if found else None
+
+
+def crop_filename(annotation_id, image_info, crop_format=None):
+    filename = f"{annotation_id}_{image_info['file_name']}"
+    if crop_format is not None:
+        filename = str(Path(filename).with_suffix(CROP_FORMATS[crop_format]))
+    return filename
+
+
+def save_crop(cropped, crop_path, crop_format=None, quality=95):
+    if crop_format == 'jpg':
+        if cropped.mode not in ('RGB', 'L'):
+            cropped = cropped.convert('RGB')
+        cropped.save(crop_path, quality=quality)
+    elif crop_format == 'png-fast':
+        # Uncompressed PNG: larger files, but several times faster to write.
+        cropped.save(crop_path, format='PNG', compress_level=0)
+    else:
+        cropped.save(crop_path)
+
+
+def cut_image_crops(task):
+    # Decodes the source image once and cuts every annotation of that image
+    # from it, whatever its category. Items are (position, annotation id,
+    # category id, bbox) tuples; crops come back as (position, annotation id,
+    # crop path, image) tuples.
+    image_path, image_info, items, output_dirs, crop_format, quality = task
+    crops = []
+    errors = []
+    
+    try:
+        with Image.open(image_path) as img:
+            limit_tiles(img, [compute_crop_box(item[3], img.width, img.height)
+                              for item in items])
+            img.load()
+            for position, annotation_id, category_id, bbox in items:
+                try:
+                    crop_box = compute_crop_box(bbox, img.width, img.height)
+                    output_dir = Path(output_dirs[category_id])
+                    crop_path = output_dir / crop_filename(annotation_id, image_info, crop_format)
+                    crops.append((position, annotation_id, crop_path, img.crop(crop_box)))
+                except Exception as e:
+                    errors.append(f"Error processing annotation {annotation_id}: {e}")
+    except Exception as e:
+        for item in items:
+            errors.append(f"Error processing annotation {item[1]}: {e}")
+    
+    return crops, errors
+
+
+def extract_image_crops(task):
+    # Runs in a worker process: cut and save every crop of one source image
+    # and return the positions of the crops that were written.
+    crop_format, quality = task[4:]
+    crops, errors = cut_image_crops(task)
+    written = []
+    
+    for position, annotation_id, crop_path, cropped in crops:
+        try:
+            save_crop(cropped, crop_path, crop_format, quality)
+            written.append(position)
+        except Exception as e:
+            errors.append(f"Error processing annotation {annotation_id}: {e}")
+    
+    return written, errors
+
+
+class CropWriter:
+    # Saves crops on background threads so encoding and writing overlap with
+    # decoding the next source image. The job queue is bounded: put() blocks
+    # once the writers fall behind, which keeps pending crops out of memory.
+    
+    def __init__(self, threads=2, max_pending=64):
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.done = queue.Queue()
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+    
+    def put(self, crop_path, cropped, crop_format=None, quality=95, tag=None):
+        self.jobs.put((crop_path, cropped, crop_format, quality, tag))
+    
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            
+            crop_path, cropped, crop_format, quality, tag = job
+            try:
+                save_crop(cropped, crop_path, crop_format, quality)
+                self.done.put((tag, None))
+            except Exception as e:
+                self.done.put((tag, e))
+    
+    def completed(self):
+        # (tag, error) for every save finished since the last call.
+        results = []
+        while True:
+            try:
+                results.append(self.done.get_nowait())
+            except queue.Empty:
+                return results
+    
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+def limit_tiles(img, boxes):
+    # Tiled and stripped TIFFs store each tile at its own offset, so tiles
+    # that do not intersect any requested box can be skipped entirely. Other
+    # formats are decoded as a single stream and are left untouched.
+    if img.format != 'TIFF' or len(img.tile) <= 1:
+        return
+    
+    def intersects(extents):
+        x0, y0, x1, y1 = extents
+        return any(x0 < bx1 and bx0 < x1 and y0 < by1 and by0 < y1
+                   for bx0, by0, bx1, by1 in boxes)
+    
+    img.tile = [tile for tile in img.tile if intersects(tile[1])]
+
+
+def decode_crop(image_path, bbox, max_size=None, padding=CROP_PADDING):
+    with perf.timer('open'):
+        img = Image.open(image_path)
+    
+    with img:
+        full_width, full_height = img.size
+        x1, y1, x2, y2 = compute_crop_box(bbox, full_width, full_height, padding)
+        
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale for free; ask for the
+        # smallest scale that still covers max_size pixels across the crop.
+        if max_size is not None and img.format == 'JPEG' and x2 > x1 and y2 > y1:
+            scale = min(max_size / (x2 - x1), max_size / (y2 - y1))
+            if scale < 1:
+                img.draft(img.mode, (max(1, math.ceil(full_width * scale)),
+                                     max(1, math.ceil(full_height * scale))))
+        
+        scale_x = img.width / full_width
+        scale_y = img.height / full_height
+        crop_box = (int(x1 * scale_x), int(y1 * scale_y),
+                    max(int(x1 * scale_x) + 1, math.ceil(x2 * scale_x)),
+                    max(int(y1 * scale_y) + 1, math.ceil(y2 * scale_y)))
+        
+        limit_tiles(img, [crop_box])
+        with perf.timer('crop'):
+            cropped = img.crop(crop_box)
+    
+    if max_size is not None:
+        cropped.thumbnail((max_size, max_size))
+    return cropped
+
+
+def decode_rle_counts(counts):
+    # Inverse of pycocotools' compressed RLE string encoding: 5-bit groups
+    # with a continuation bit, and deltas against the count two places back.
+    decoded = []
+    position = 0
+    while position < len(counts):
+        value = 0
+        shift = 0
+        more = True
+        while more:
+            char = ord(counts[position]) - 48
+            value |= (char & 0x1f) << (5 * shift)
+            more = char & 0x20
+            position += 1
+            shift += 1
+            if not more and char & 0x10:
+                value |= -1 << (5 * shift)
+        if len(decoded) > 2:
+            value += decoded[-2]
+        decoded.append(value)
+    return decoded
+
+
+def rle_mask_rects(rle, region):
+    # COCO RLE runs are column-major and alternate background/foreground.
+    # Foreground runs are split into per-column segments inside region, and
+    # identical segments in neighbouring columns are merged into rectangles.
+    height = rle['size'][0]
+    counts = rle['counts']
+    if isinstance(counts, str):
+        counts = decode_rle_counts(counts)
+    
+    x1, y1, x2, y2 = region
+    columns = {}
+    position = 0
+    for i, count in enumerate(counts):
+        start = position
+        position += count
+        if i % 2 == 0 or count == 0:
+            continue
+        
+        while start < position:
+            col, row = divmod(start, height)
+            end_row = min(height, row + position - start)
+            if x1 <= col < x2:
+                top, bottom = max(row, y1), min(end_row, y2)
+                if top < bottom:
+                    columns.setdefault(col, []).append((top, bottom))
+            start += end_row - row
+    
+    rects = []
+    open_rects = {}
+    for col in sorted(columns):
+        still_open = {}
+        for segment in columns[col]:
+            rect = open_rects.get(segment)
+            if rect is not None and rect[2] == col:
+                rect[2] = col + 1
+            else:
+                rect = [col, segment[0], col + 1, segment[1]]
+                rects.append(rect)
+            still_open[segment] = rect
+        open_rects = still_open
+    return [tuple(rect) for rect in rects]
+
+
+def annotation_overlay_shapes(annotation, crop_size, padding=CROP_PADDING):
+    # Shapes in the coordinate system of the padded crop. The crop origin
+    # only depends on the bbox, because clamping happens at the far edge.
+    x, y, w, h = annotation['bbox']
+    origin_x = max(0, int(x - padding))
+    origin_y = max(0, int(y - padding))
+    
+    shapes = {
+        'bbox': (x - origin_x, y - origin_y, x + w - origin_x, y + h - origin_y),
+        'polygons': [],
+        'mask_rects': []
+    }
+    
+    segmentation = annotation.get('segmentation')
+    if isinstance(segmentation, list):
+        for polygon in segmentation:
+            if len(polygon) >= 6:
+                shapes['polygons'].append(
+                    [value - (origin_x if i % 2 == 0 else origin_y)
+                     for i, value in enumerate(polygon)])
+    elif isinstance(segmentation, dict) and 'counts' in segmentation:
+        region = (origin_x, origin_y, origin_x + crop_size[0], origin_y + crop_size[1])
+        shapes['mask_rects'] = [(rx1 - origin_x, ry1 - origin_y, rx2 - origin_x, ry2 - origin_y)
+                                for rx1, ry1, rx2, ry2 in rle_mask_rects(segmentation, region)]
+    
+    return shapes
+
+
+def load_instance_image(instance, max_size=None):
+    if instance['path'] is not None:
+        with perf.timer('open'):
+            img = Image.open(instance['path'])
+        if max_size is not None:
+            img.draft(img.mode, (max_size, max_size))
+            img.thumbnail((max_size, max_size))
+        return img
+    
+    # Virtual crop: cut the padded bbox from the source image on demand.
+    return decode_crop(instance['original_image'], instance['annotation']['bbox'], max_size)
+
+
+def instance_display_name(instance):
+    if instance['path'] is not None:
+        return instance['path'].name
+    return f"{instance['annotation']['id']}_{instance['image_info']['file_name']}"
+
+
+def build_virtual_instances(coco_index, categories, images_dir, dir_index=None, missing=None):
+    # No crops are written, so the queue is just the positions whose source
+    # image exists; each image is checked once however many boxes it has.
+    instances = InstanceStore(coco_index, images_dir)
+    available = {}
+    image_ids = coco_index.annotation_image_ids
+    for category in categories:
+        for position in coco_index.category_index.get(category['id'], ()):
+            image_id = image_ids[position]
+            found = available.get(image_id)
+            if found is None:
+                image_info = coco_index.get_image(image_id)
+                found = bool(image_info) and find_source_image(image_info, images_dir,
+                                                               dir_index) is not None
+                if image_info and not found and missing is not None:
+                    missing.append(image_info['file_name'])
+                available[image_id] = found
+            if found:
+                instances.append(position)
+    return instances
+
+
+def extract_crops(coco_index, categories, images_dir, output_dirs,
+                  workers=None, progress_callback=None, crop_format=None, quality=95,
+                  dir_index=None, missing=None):
+    # output_dirs maps each category id to the directory its crops go to.
+    manifests = {}
+    for category_id, output_dir in output_dirs.items():
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        manifests[category_id] = CropManifest(output_dir).load()
+    
+    annotation_ids = coco_index.annotation_ids
+    category_ids = coco_index.annotation_category_ids
+    written = bytearray(coco_index.num_annotations)
+    groups = group_positions_by_image(coco_index, [category['id'] for category in categories])
+    total = len(groups)
+    done = 0
+    submitted = False
+    
+    def advance():
+        nonlocal done
+        done += 1
+        if progress_callback:
+            progress_callback(done, total)
+    
+    def pending_tasks():
+        # Annotations whose crop is already on disk with a matching cache key
+        # are served from the manifest; only new or changed ones go to the
+        # workers. Tasks are built as they are submitted, so only the ones in
+        # flight hold per-annotation tuples.
+        for image_id, positions in groups.items():
+            image_info = coco_index.get_image(image_id)
+            image_path = None
+            if image_info:
+                image_path = find_source_image(image_info, images_dir, dir_index)
+                if image_path is None and missing is not None:
+                    missing.append(image_info['file_name'])
+            if image_path is None:
+                advance()
+                continue
+            
+            source_stat = image_path.stat()
+            items = []
+            keys = {}
+            for position in positions:
+                annotation_id = annotation_ids[position]
+                bbox = coco_index.get_bbox(position)
+                key = crop_cache_key(annotation_id, bbox, source_stat, crop_format, quality)
+                if manifests[category_ids[position]].lookup(annotation_id, key, image_info):
+                    written[position] = 1
+                else:
+                    keys[position] = key
+                    items.append((position, annotation_id, category_ids[position], bbox))
+            
+            if items:
+                yield (image_path, image_info, items, output_dirs, crop_format, quality), keys
+            else:
+                advance()
+    
+    def record(position, key):
+        nonlocal submitted
+        submitted = True
+        written[position] = 1
+        manifests[category_ids[position]].add(annotation_ids[position], key, crop_format)
+    
+    def collect(result, keys):
+        task_written, task_errors = result
+        for position in task_written:
+            record(position, keys[position])
+        for error in task_errors:
+            print(error)
+        advance()
+    
+    def collect_saved(completed):
+        for (position, annotation_id, key), error in completed:
+            if error is None:
+                record(position, key)
+            else:
+                print(f"Error processing annotation {annotation_id}: {error}")
+    
+    if workers == 1 or total <= 1:
+        # Crops are saved on writer threads while the next image decodes.
+        writer = CropWriter()
+        try:
+            for task, keys in pending_tasks():
+                crops, errors = cut_image_crops(task)
+                for position, annotation_id, crop_path, cropped in crops:
+                    writer.put(crop_path, cropped, crop_format, quality,
+                               (position, annotation_id, keys[position]))
+                for error in errors:
+                    print(error)
+                advance()
+                collect_saved(writer.completed())
+        finally:
+            writer.close()
+        collect_saved(writer.completed())
+    else:
+        # A bounded number of tasks in flight keeps memory flat on queues
+        # with millions of annotations.
+        max_pending = (workers or os.cpu_count() or 1) * 4
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            for task, keys in pending_tasks():
+                pending[executor.submit(extract_image_crops, task)] = keys
+                if len(pending) >= max_pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        collect(future.result(), pending.pop(future))
+            for future in as_completed(pending):
+                collect(future.result(), pending[future])
+    
+    if submitted:
+        for manifest in manifests.values():
+            manifest.save()
+    
+    # Workers finish in arbitrary order; keep the review queue in annotation order.
+    instances = InstanceStore(coco_index, images_dir)
+    for category in categories:
+        crop_slot = instances.add_crop_dir(output_dirs[category['id']], crop_format)
+        for position in coco_index.category_index.get(category['id'], ()):
+            if written[position]:
+                instances.append(position, crop_slot)
+    return instances
+
+
+def extract_category_crops(coco_index, category, images_dir, output_root='output',
+                           workers=None, progress_callback=None, write_crops=True,
+                           crop_format=None, quality=95):
+    return extract_categories_crops(coco_index, [category], images_dir, output_root,
+                                    workers=workers, progress_callback=progress_callback,
+                                    write_crops=write_crops, crop_format=crop_format,
+                                    quality=quality)
+
+
+def extract_categories_crops(coco_index, categories, images_dir, output_root='output',
+                             workers=None, progress_callback=None, write_crops=True,
+                             crop_format=None, quality=95):
+    # All selected categories are handled in one pass, so a source image
+    # shared by several of them is decoded once. The queue is ordered by
+    # category, then by annotation order within the category.
+    dir_index = ImageDirIndex.for_directory(images_dir)
+    missing = []
+    
+    if not write_crops:
+        instances = build_virtual_instances(coco_index, categories, images_dir,
+                                            dir_index, missing)
+    else:
+        output_dirs = {category['id']: Path(output_root) / category['name']
+                       for category in categories}
+        instances = extract_crops(coco_index, categories, images_dir, output_dirs,
+                                  workers=workers, progress_callback=progress_callback,
+                                  crop_format=crop_format, quality=quality,
+                                  dir_index=dir_index, missing=missing)
+    
+    if missing:
+        names = ', '.join(category['name'] for category in categories)
+        print(f"{names}: skipped {len(missing)} images missing from {images_dir}")
+    return instances
+
+
+def rejected_set_path(output_root, category, export_format='json', name_suffix=''):
+    return (Path(output_root) /
+            f'rejected_{category["name"]}{name_suffix}{EXPORT_FORMATS[export_format]}')
+
+
+def write_rejected_set(output_path, rejected_annotations, categories, coco_index,
+                       export_format='json', progress_callback=None):
+    # Written to a temporary file and renamed into place, so an interrupted
+    # export never leaves a truncated rejected set behind.
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    if export_format == 'npz':
+        write_rejected_npz(tmp_path, rejected_annotations)
+    else:
+        write_rejected_json(tmp_path, rejected_annotations, categories, coco_index,
+                            export_format, progress_callback)
+    os.replace(tmp_path, output_path)
+    if progress_callback:
+        progress_callback(len(rejected_annotations))
+
+
+def write_rejected_json(output_path, rejected_annotations, categories, coco_index,
+                        export_format='json', progress_callback=None):
+    # Annotations are streamed one at a time with compact separators; the
+    # referenced images are looked up in the persistent index afterwards.
+    separators = (',', ':')
+    image_ids = set()
+    
+    if export_format == 'json.gz':
+        # gzip defaults to level 9, which dominates export time for little
+        # gain on JSON; a low level keeps writing close to disk speed.
+        f = gzip.open(output_path, 'wt', compresslevel=GZIP_LEVEL)
+    else:
+        f = open(output_path, 'w')
+    
+    with f:
+        f.write('{"annotations":[')
+        for i, ann in enumerate(rejected_annotations):
+            if i:
+                f.write(',')
+            f.write(json.dumps(ann, separators=separators))
+            image_ids.add(ann['image_id'])
+            if progress_callback and i % 1000 == 999:
+                progress_callback(i + 1)
+        
+        f.write('],"images":[')
+        first = True
+        for img_id in image_ids:
+            image_info = coco_index.get_image(img_id)
+            if image_info is None:
+                continue
+            if not first:
+                f.write(',')
+            f.write(json.dumps(image_info, separators=separators))
+            first = False
+        
+        f.write('],"categories":')
+        f.write(json.dumps(categories, separators=separators))
+        f.write('}')
+
+
+def write_rejected_sets(output_root, rejected_annotations, categories, coco_index,
+                        export_format='json', progress_callback=None, name_suffix=''):
+    # One rejected set per category, named like a single-category review.
+    by_category = {}
+    for ann in rejected_annotations:
+        by_category.setdefault(ann['category_id'], []).append(ann)
+    
+    Path(output_root).mkdir(parents=True, exist_ok=True)
+    output_paths = []
+    total = len(rejected_annotations)
+    written = 0
+    for category in categories:
+        rejected = by_category.get(category['id'])
+        if not rejected:
+            continue
+        
+        report = None
+        if progress_callback:
+            report = lambda done, offset=written: progress_callback(offset + done, total)
+        output_path = rejected_set_path(output_root, category, export_format, name_suffix)
+        write_rejected_set(output_path, rejected, [category], coco_index, export_format,
+                           report)
+        output_paths.append(output_path)
+        written += len(rejected)
+    return output_paths
+
+
+def write_rejected_npz(output_path, rejected_annotations):
+    if np is None:
+        raise RuntimeError("NumPy is required for NPZ export. Install with: pip install numpy")
+    
+    annotation_ids = array('q')
+    image_ids = array('q')
+    category_ids = array('q')
+    bboxes = array('d')
+    for ann in rejected_annotations:
+        annotation_ids.append(ann['id'])
+        image_ids.append(ann['image_id'])
+        category_ids.append(ann['category_id'])
+        bboxes.extend(ann['bbox'])
+    
+    with open(output_path, 'wb') as f:
+        np.savez(f,
+                 annotation_ids=np.frombuffer(annotation_ids, dtype=np.int64),
+                 image_ids=np.frombuffer(image_ids, dtype=np.int64),
+                 category_ids=np.frombuffer(category_ids, dtype=np.int64),
+                 bboxes=np.frombuffer(bboxes, dtype=np.float64).reshape(-1, 4))
+
+
+def crop_cache_key(annotation_id, bbox, source_stat, crop_format=None, quality=95,
+                   padding=CROP_PADDING):
+    payload = json.dumps([annotation_id, list(bbox), padding, crop_format, quality,
+                          source_stat.st_mtime_ns, source_stat.st_size])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class CropManifest:
+    # Records every crop written to a category's output directory, keyed by
+    # annotation id, so unchanged crops are not re-extracted and a previous
+    # run can be reviewed again without opening any image file.
+    
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / 'manifest.json'
+        self.entries = {}
+    
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f).get('entries', {})
+        except (OSError, ValueError):
+            self.entries = {}
+        return self
+    
+    def save(self):
+        tmp_path = self.path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'padding': CROP_PADDING, 'entries': self.entries}, f,
+                      separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+    
+    def exists(self):
+        return self.path.exists()
+    
+    def lookup(self, annotation_id, key, image_info):
+        entry = self.entries.get(str(annotation_id))
+        if entry is None or entry[0] != key:
+            return False
+        return (self.output_dir / crop_filename(annotation_id, image_info, entry[1])).exists()
+    
+    def add(self, annotation_id, key, crop_format=None):
+        self.entries[str(annotation_id)] = [key, crop_format]
+    
+    def load_into(self, instances, category_id):
+        # Appends this category's cached crops to an InstanceStore, in
+        # annotation order.
+        coco_index = instances.coco_index
+        for position in coco_index.category_index.get(category_id, ()):
+            entry = self.entries.get(str(coco_index.annotation_ids[position]))
+            if entry is not None:
+                instances.append(position, instances.add_crop_dir(self.output_dir, entry[1]))
+        return instances
+
+
+class ImageDirIndex:
+    # In-memory set of the file names in an images directory, built with a
+    # single os.scandir pass. Indexes are cached per directory and rebuilt
+    # only when the directory's mtime changes, so existence checks during
+    # processing never go back to the filesystem. Subdirectory indexes get
+    # the same mtime check whenever the cached index is handed out.
+    
+    cache = {}
+    cache_lock = threading.Lock()
+    
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.names = set()
+        self.mtime_ns = None
+        self.subdirs = {}
+    
+    @classmethod
+    def for_directory(cls, directory):
+        directory = Path(directory)
+        mtime_ns = os.stat(directory).st_mtime_ns
+        
+        with cls.cache_lock:
+            index = cls.cache.get(str(directory))
+            if index is None or index.mtime_ns != mtime_ns:
+                index = cls(directory)
+                index.scan()
+                cls.cache[str(directory)] = index
+            else:
+                index.refresh_subdirs()
+            return index
+    
+    def scan(self):
+        self.mtime_ns = os.stat(self.directory).st_mtime_ns
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    self.names.add(entry.name)
+    
+    def subdir_index(self, parent):
+        subdir = ImageDirIndex(self.directory / parent)
+        try:
+            subdir.scan()
+        except OSError:
+            pass
+        self.subdirs[parent] = subdir
+        return subdir
+    
+    def refresh_subdirs(self):
+        for parent, subdir in list(self.subdirs.items()):
+            try:
+                mtime_ns = os.stat(subdir.directory).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            if mtime_ns != subdir.mtime_ns:
+                self.subdir_index(parent)
+    
+    def exists(self, file_name):
+        parent, name = os.path.split(file_name)
+        if not parent:
+            return name in self.names
+        
+        # File names with a subdirectory get their own index on first use.
+        subdir = self.subdirs.get(parent)
+        if subdir is None:
+            subdir = self.subdir_index(parent)
+        return name in subdir.names
+    
+    def image_count(self):
+        return sum(1 for name in self.names
+                   if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+    
+    def missing_images(self, images):
+        return [img['file_name'] for img in images if not self.exists(img['file_name'])]
+
+
+COCO_ITEM_PREFIXES = ('images.item', 'categories.item', 'annotations.item')
+
+
+def stream_coco_items(path, prefixes):
+    # Yields (prefix, item) for every element of the wanted top-level arrays
+    # from one ijson.parse pass, building each item straight from the events.
+    # Separate ijson.items calls would re-parse the whole file once per array.
+    stack = []
+    keys = []
+    key = None
+    item = None
+    item_prefix = None
+    with open(path, 'rb') as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if stack:
+                if event == 'map_key':
+                    key = value
+                    continue
+                top = stack[-1]
+                if event == 'start_map' or event == 'start_array':
+                    child = {} if event == 'start_map' else []
+                    if top.__class__ is dict:
+                        top[key] = child
+                        keys.append(key)
+                    else:
+                        top.append(child)
+                        keys.append(None)
+                    stack.append(child)
+                elif event == 'end_map' or event == 'end_array':
+                    stack.pop()
+                    if stack:
+                        key = keys.pop()
+                    else:
+                        yield item_prefix, item
+                elif top.__class__ is dict:
+                    top[key] = value
+                else:
+                    top.append(value)
+            elif event == 'start_map' and prefix in prefixes:
+                item = {}
+                item_prefix = prefix
+                stack.append(item)
+
+
+class COCOIndex:
+    # Compact, array-backed view of a COCO file. Full annotation records are
+    # spilled as minified JSON to an anonymous temporary file and read back by
+    # offset only when needed, so memory per annotation is the fixed-width
+    # columns plus one offset; per-category position arrays make lookups
+    # O(k) instead of full rescans. Per-image grouping is done on demand by
+    # group_positions_by_image for the categories being processed.
+    
+    def __init__(self):
+        self.images = []
+        self.image_positions = {}
+        self.categories = []
+        self.annotation_ids = array('q')
+        self.annotation_image_ids = array('q')
+        self.annotation_category_ids = array('q')
+        self.annotation_bboxes = array('d')
+        self.annotation_crowd = array('b')
+        self.record_offsets = array('q', [0])
+        self.records_file = None
+        self.records_appending = True
+        self.records_lock = threading.Lock()
+        self.category_index = {}
+    
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        
+        if ijson is not None:
+            # A single streaming pass keeps peak memory close to the size of
+            # the index rather than the size of the parsed file.
+            for prefix, item in stream_coco_items(path, COCO_ITEM_PREFIXES):
+                if prefix == 'annotations.item':
+                    index.add_annotation(item)
+                elif prefix == 'images.item':
+                    index.add_image(item)
+                else:
+                    index.categories.append(item)
+        else:
+            with open(path, 'r') as f:
+                coco_data = json.load(f)
+            for img in coco_data.get('images', []):
+                index.add_image(img)
+            index.categories = coco_data.get('categories', [])
+            for ann in coco_data.get('annotations', []):
+                index.add_annotation(ann)
+            del coco_data
+        
+        return index
+    
+    def add_image(self, img):
+        self.image_positions[img['id']] = len(self.images)
+        self.images.append(img)
+    
+    def add_annotation(self, ann):
+        position = len(self.annotation_ids)
+        self.annotation_ids.append(ann['id'])
+        self.annotation_image_ids.append(ann['image_id'])
+        self.annotation_category_ids.append(ann['category_id'])
+        self.annotation_bboxes.extend(ann['bbox'][:4])
+        self.annotation_crowd.append(1 if ann.get('iscrowd') else 0)
+        if self.records_file is None:
+            self.records_file = tempfile.TemporaryFile()
+        record = json.dumps(ann, separators=(',', ':')).encode('utf-8')
+        with self.records_lock:
+            # Reads move the file position; appends only seek back after one.
+            if not self.records_appending:
+                self.records_file.seek(self.record_offsets[-1])
+                self.records_appending = True
+            self.records_file.write(record)
+        self.record_offsets.append(self.record_offsets[-1] + len(record))
+        
+        self.category_index.setdefault(ann['category_id'], array('l')).append(position)
+    
+    @property
+    def num_images(self):
+        return len(self.images)
+    
+    @property
+    def num_annotations(self):
+        return len(self.annotation_ids)
+    
+    def get_image(self, image_id):
+        position = self.image_positions.get(image_id)
+        if position is None:
+            return None
+        return self.images[position]
+    
+    def get_annotation(self, position):
+        start = self.record_offsets[position]
+        end = self.record_offsets[position + 1]
+        with self.records_lock:
+            self.records_appending = False
+            self.records_file.seek(start)
+            record = self.records_file.read(end - start)
+        return json.loads(record)
+    
+    def get_bbox(self, position):
+        return self.annotation_bboxes[position * 4:position * 4 + 4].tolist()
+    
+    def category_count(self, category_id):
+        return len(self.category_index.get(category_id, ()))
+    
+    def annotations_for_category(self, category_id):
+        return [self.get_annotation(position)
+                for position in self.category_index.get(category_id, ())]
+
+
+class InstanceStore:
+    # Columnar review queue: per instance only its annotation position in the
+    # COCOIndex and a slot into a short list of interned crop directories,
+    # about a dozen bytes each. The instance dict is built on access, so only
+    # the instances being displayed or prefetched are ever materialized.
+    
+    def __init__(self, coco_index, images_dir):
+        self.coco_index = coco_index
+        self.images_dir = Path(images_dir)
+        self.positions = array('q')
+        self.crop_slots = array('l')
+        self.crop_dirs = []
+    
+    def add_crop_dir(self, crop_dir, crop_format=None):
+        # A slot of -1 marks a virtual crop cut from the source image.
+        entry = (Path(crop_dir), crop_format)
+        if entry not in self.crop_dirs:
+            self.crop_dirs.append(entry)
+        return self.crop_dirs.index(entry)
+    
+    def append(self, position, crop_slot=-1):
+        self.positions.append(position)
+        self.crop_slots.append(crop_slot)
+    
+    def __len__(self):
+        return len(self.positions)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.subset(range(len(self))[index])
+        
+        annotation = self.coco_index.get_annotation(self.positions[index])
+        image_info = self.coco_index.get_image(annotation['image_id'])
+        
+        path = None
+        crop_slot = self.crop_slots[index]
+        if crop_slot >= 0:
+            crop_dir, crop_format = self.crop_dirs[crop_slot]
+            path = crop_dir / crop_filename(annotation['id'], image_info, crop_format)
+        
+        return {
+            'path': path,
+            'annotation': annotation,
+            'image_info': image_info,
+            'original_image': self.images_dir / image_info['file_name']
+        }
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    
+    def annotation_id(self, index):
+        return self.coco_index.annotation_ids[self.positions[index]]
+    
+    def category_id(self, index):
+        return self.coco_index.annotation_category_ids[self.positions[index]]
+    
+    def subset(self, indices):
+        instances = InstanceStore(self.coco_index, self.images_dir)
+        instances.crop_dirs = self.crop_dirs
+        for index in indices:
+            instances.append(self.positions[index], self.crop_slots[index])
+        return instances
+
+
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    return inter / (aw * ah + bw * bh - inter)
+
+
+def overlapping_pairs(boxes, min_iou=0.0):
+    # Uniform grid over one image's [x, y, w, h] boxes, so only boxes that
+    # share a cell are compared. A pair is reported from the cell holding the
+    # top-left corner of its intersection, and therefore only once. Cells
+    # follow the median box size, bounded so a huge box spans at most 64x64.
+    valid = [i for i, (_, _, w, h) in enumerate(boxes) if w > 0 and h > 0]
+    if len(valid) < 2:
+        return
+    
+    sizes = sorted(max(boxes[i][2], boxes[i][3]) for i in valid)
+    extent = max(max(boxes[i][0] + boxes[i][2], boxes[i][1] + boxes[i][3]) for i in valid)
+    cell = max(sizes[len(sizes) // 2], extent / 64, 1.0)
+    
+    grid = {}
+    for i in valid:
+        x, y, w, h = boxes[i]
+        for cx in range(int(x // cell), int((x + w) // cell) + 1):
+            for cy in range(int(y // cell), int((y + h) // cell) + 1):
+                grid.setdefault((cx, cy), []).append(i)
+    
+    for (cx, cy), members in grid.items():
+        for k, i in enumerate(members):
+            for j in members[k + 1:]:
+                left = max(boxes[i][0], boxes[j][0])
+                top = max(boxes[i][1], boxes[j][1])
+                if int(left // cell) != cx or int(top // cell) != cy:
+                    continue
+                iou = box_iou(boxes[i], boxes[j])
+                if iou > min_iou:
+                    yield i, j, iou
+
+
+def image_size(coco_index, image_id):
+    # Unknown sizes are infinite, so no box is out of bounds against them.
+    image_info = coco_index.get_image(image_id) or {}
+    return image_info.get('width') or math.inf, image_info.get('height') or math.inf
+
+
+def score_boxes(coco_index, positions, scores):
+    # Per-box heuristics for the given annotation positions, written into
+    # scores. Vectorized over the COCOIndex columns when NumPy is available.
+    weights = SUSPICION_WEIGHTS
+    
+    if np is not None:
+        index = np.array(positions, dtype=np.int64)
+        x, y, w, h = np.frombuffer(coco_index.annotation_bboxes,
+                                   dtype=np.float64).reshape(-1, 4)[index].T
+        image_ids = np.frombuffer(coco_index.annotation_image_ids, dtype=np.int64)[index]
+        unique_ids, inverse = np.unique(image_ids, return_inverse=True)
+        sizes = np.array([image_size(coco_index, image_id) for image_id in unique_ids.tolist()],
+                         dtype=np.float64).reshape(-1, 2)[inverse]
+        width, height = sizes.T
+        crowd = np.frombuffer(coco_index.annotation_crowd, dtype=np.int8)[index]
+        
+        degenerate = (w <= 0) | (h <= 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            aspect = np.maximum(w / h, h / w)
+        score = weights['degenerate'] * degenerate
+        score += weights['tiny'] * (~degenerate & (w * h < TINY_BOX_AREA))
+        score += weights['aspect'] * (~degenerate & (aspect > EXTREME_ASPECT_RATIO))
+        score += weights['out_of_bounds'] * ((x < 0) | (y < 0) |
+                                             (x + w > width + 1) | (y + h > height + 1))
+        score += weights['crowd'] * (crowd != 0)
+        np.frombuffer(scores, dtype=np.float32)[index] = score
+        return
+    
+    sizes = {}
+    for position in positions:
+        image_id = coco_index.annotation_image_ids[position]
+        if image_id not in sizes:
+            sizes[image_id] = image_size(coco_index, image_id)
+        width, height = sizes[image_id]
+        x, y, w, h = coco_index.get_bbox(position)
+        
+        score = 0.0
+        if w <= 0 or h <= 0:
+            score += weights['degenerate']
+        else:
+            if w * h < TINY_BOX_AREA:
+                score += weights['tiny']
+            if max(w / h, h / w) > EXTREME_ASPECT_RATIO:
+                score += weights['aspect']
+        if x < 0 or y < 0 or x + w > width + 1 or y + h > height + 1:
+            score += weights['out_of_bounds']
+        if coco_index.annotation_crowd[position]:
+            score += weights['crowd']
+        scores[position] = score
+
+
+def suspicion_scores(coco_index, category_ids, duplicate_index=None):
+    # Scores each annotation of the given categories on cheap heuristics.
+    # Returns a float array indexed by annotation position; unscored
+    # positions are 0. Overlaps come from the DuplicateIndex pairs.
+    if duplicate_index is None:
+        duplicate_index = DuplicateIndex(coco_index)
+    scores = array('f', bytes(4 * coco_index.num_annotations))
+    
+    for category_id in category_ids:
+        score_boxes(coco_index, coco_index.category_index.get(category_id, array('l')), scores)
+        
+        best_iou = {}
+        for first, second, iou in zip(*duplicate_index.pairs(category_id)):
+            if iou > OVERLAP_IOU:
+                best_iou[first] = max(best_iou.get(first, 0.0), iou)
+                best_iou[second] = max(best_iou.get(second, 0.0), iou)
+        for position, iou in best_iou.items():
+            if iou >= DUPLICATE_IOU:
+                scores[position] += SUSPICION_WEIGHTS['duplicate']
+            else:
+                scores[position] += SUSPICION_WEIGHTS['overlap']
+    
+    return scores
+
+
+class DuplicateIndex:
+    # Same-category box pairs overlapping above min_iou, found image by image
+    # with overlapping_pairs and kept per category as (first position,
+    # second position, IoU) columns. Built once per loaded COCO file, on a
+    # background thread via build(); the suspicion scores and the duplicate
+    # rejection both read the same pairs.
+    
+    def __init__(self, coco_index, min_iou=OVERLAP_IOU):
+        self.coco_index = coco_index
+        self.min_iou = min_iou
+        self.pairs_by_category = {}
+        self.lock = threading.Lock()
+        self.stopped = False
+    
+    def build(self):
+        for category in self.coco_index.categories:
+            if self.stopped:
+                return
+            self.pairs(category['id'])
+    
+    def stop(self):
+        self.stopped = True
+    
+    def pairs(self, category_id):
+        with self.lock:
+            pairs = self.pairs_by_category.get(category_id)
+            if pairs is None:
+                pairs = (array('q'), array('q'), array('d'))
+                firsts, seconds, ious = pairs
+                for positions in group_positions_by_image(self.coco_index,
+                                                          [category_id]).values():
+                    boxes = [self.coco_index.get_bbox(position) for position in positions]
+                    for i, j, iou in overlapping_pairs(boxes, self.min_iou):
+                        firsts.append(positions[i])
+                        seconds.append(positions[j])
+                        ious.append(iou)
+                self.pairs_by_category[category_id] = pairs
+        return pairs
+    
+    def duplicates(self, category_ids, min_iou=DUPLICATE_IOU):
+        # The later annotation of each pair is the duplicate, so the first
+        # box of a group of copies is kept.
+        flagged = set()
+        for category_id in category_ids:
+            _, seconds, ious = self.pairs(category_id)
+            flagged.update(second for second, iou in zip(seconds, ious) if iou > min_iou)
+        return sorted(flagged)
+    
+    def duplicate_annotations(self, category_ids, min_iou=DUPLICATE_IOU):
+        return [self.coco_index.get_annotation(position)
+                for position in self.duplicates(category_ids, min_iou)]
+
+
+def prioritize_instances(instances, duplicate_index=None):
+    # Most suspicious first within each category; the sort is stable, so
+    # equally scored instances keep annotation order and categories stay
+    # grouped for jump-to-category.
+    ranks = {}
+    for i in range(len(instances)):
+        ranks.setdefault(instances.category_id(i), len(ranks))
+    scores = suspicion_scores(instances.coco_index, list(ranks), duplicate_index)
+    positions = instances.positions
+    order = sorted(range(len(instances)),
+                   key=lambda i: (ranks[instances.category_id(i)], -scores[positions[i]]))
+    return instances.subset(order)
+
+
+class ImagePyramid:
+    # Mipmap levels of an image, each half the size of the previous one.
+    # Rendering picks the smallest level that still has enough resolution for
+    # the zoom and resamples only the requested region of it.
+    
+    def __init__(self, image, min_size=64):
+        # reduce() rejects palette, bilevel and 16-bit images, so those are
+        # converted once to a mode it (and Tk) handles.
+        if image.mode.startswith('I') or image.mode in ('1', 'F'):
+            image = image.convert('L')
+        elif image.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+            has_alpha = image.mode.endswith('A') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        self.levels = [image]
+        while min(self.levels[-1].size) >= 2 * min_size:
+            self.levels.append(self.levels[-1].reduce(2))
+    
+    @property
+    def width(self):
+        return self.levels[0].width
+    
+    @property
+    def height(self):
+        return self.levels[0].height
+    
+    def level_for_zoom(self, zoom):
+        level_index = 0
+        while (level_index + 1 < len(self.levels) and
+               self.levels[level_index + 1].width / self.width >= zoom):
+            level_index += 1
+        return self.levels[level_index]
+    
+    def render(self, zoom, region, size, resample=None):
+        if resample is None:
+            resample = Image.Resampling.LANCZOS
+        
+        level = self.level_for_zoom(zoom)
+        scale_x = level.width / self.width
+        scale_y = level.height / self.height
+        x1, y1, x2, y2 = region
+        box = (x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y)
+        with perf.timer('resize'):
+            return level.resize(size, resample, box=box)
+
+
+class RedrawScheduler:
+    # Coalesces bursts of redraw requests into at most one draw per frame.
+    # While input keeps arriving a cheap BILINEAR preview is drawn; once input
+    # has been idle for idle_ms the view is refined with LANCZOS.
+    
+    def __init__(self, root, draw, frame_ms=16, idle_ms=150):
+        self.root = root
+        self.draw = draw
+        self.frame_ms = frame_ms
+        self.idle_ms = idle_ms
+        self.pending_id = None
+        self.refine_id = None
+        self.frame_times = deque(maxlen=120)
+        self.frame_count = 0
+    
+    def request(self):
+        if self.refine_id is not None:
+            self.root.after_cancel(self.refine_id)
+            self.refine_id = None
+        if self.pending_id is None:
+            self.pending_id = self.root.after(self.frame_ms, self.flush)
+    
+    def flush(self):
+        self.pending_id = None
+        self.run_draw(Image.Resampling.BILINEAR)
+        self.refine_id = self.root.after(self.idle_ms, self.refine)
+    
+    def refine(self):
+        self.refine_id = None
+        self.run_draw(Image.Resampling.LANCZOS)
+    
+    def run_draw(self, resample):
+        start = time.perf_counter()
+        self.draw(resample)
+        self.frame_times.append((time.perf_counter() - start) * 1000)
+        self.frame_count += 1
+    
+    def cancel(self):
+        if self.pending_id is not None:
+            self.root.after_cancel(self.pending_id)
+            self.pending_id = None
+        if self.refine_id is not None:
+            self.root.after_cancel(self.refine_id)
+            self.refine_id = None
+    
+    @property
+    def last_frame_ms(self):
+        return self.frame_times[-1] if self.frame_times else 0.0
+    
+    @property
+    def max_frame_ms(self):
+        return max(self.frame_times) if self.frame_times else 0.0
+
+
+class OverlayCache:
+    # Small LRU of overlay shapes per annotation, so decoded RLE masks survive
+    # navigation and overlay toggling.
+    
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+    
+    def get(self, annotation, crop_size):
+        key = annotation['id']
+        shapes = self.entries.get(key)
+        if shapes is None:
+            with perf.timer('overlay_decode'):
+                shapes = annotation_overlay_shapes(annotation, crop_size)
+            self.entries[key] = shapes
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        return shapes
+    
+    def clear(self):
+        self.entries.clear()
+
+
+class DecodeCache:
+    # Thread-safe LRU of decoded crops, bounded by an approximate byte budget.
+    # Entries are images or ImagePyramids; a pyramid counts all its levels.
+    
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def image_bytes(img):
+        if isinstance(img, ImagePyramid):
+            return sum(DecodeCache.image_bytes(level) for level in img.levels)
+        return img.width * img.height * len(img.getbands())
+    
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+    
+    def get(self, key):
+        with self.lock:
+            img = self.entries.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return img
+    
+    def put(self, key, img):
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= self.image_bytes(previous)
+            
+            self.entries[key] = img
+            self.current_bytes += self.image_bytes(img)
+            
+            while self.current_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= self.image_bytes(evicted)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+    
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class InstancePrefetcher:
+    # Decodes the instances around the current index and builds their
+    # pyramids on a background thread, so that keyboard navigation is served
+    # from the DecodeCache without any work on the Tk thread.
+    
+    def __init__(self, instances, cache, ahead=8, behind=2):
+        self.instances = instances
+        self.cache = cache
+        self.ahead = ahead
+        self.behind = behind
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def request(self, index):
+        self.requests.put(index)
+    
+    def stop(self):
+        self.requests.put(None)
+    
+    def run(self):
+        while True:
+            index = self.requests.get()
+            
+            # Only the most recent position matters; skip stale requests.
+            while not self.requests.empty():
+                index = self.requests.get()
+            if index is None:
+                return
+            
+            order = list(range(index + 1, index + 1 + self.ahead))
+            order += list(range(index - 1, index - 1 - self.behind, -1))
+            
+            for i in order:
+                if not self.requests.empty():
+                    break
+                if i < 0 or i >= len(self.instances):
+                    continue
+                
+                key = self.instances.annotation_id(i)
+                if key in self.cache:
+                    continue
+                
+                try:
+                    img = load_instance_image(self.instances[i])
+                    img.load()
+                    self.cache.put(key, ImagePyramid(img))
+                except Exception as e:
+                    print(f"Error prefetching annotation {key}: {e}")
+
+
+class ThumbnailLoader:
+    # Generates downscaled thumbnails for the grid review mode on a background
+    # thread. Finished indices are posted to the ready queue, which the UI
+    # polls from the Tk main loop.
+    
+    def __init__(self, instances, cache, decode_cache=None, size=THUMBNAIL_SIZE):
+        self.instances = instances
+        self.cache = cache
+        self.decode_cache = decode_cache
+        self.size = size
+        self.requests = queue.Queue()
+        self.ready = queue.Queue()
+        self.failed = set()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def request(self, indices):
+        self.requests.put(list(indices))
+    
+    def stop(self):
+        self.requests.put(None)
+    
+    def run(self):
+        while True:
+            indices = self.requests.get()
+            while not self.requests.empty():
+                indices = self.requests.get()
+            if indices is None:
+                return
+            
+            for i in indices:
+                if not self.requests.empty():
+                    break
+                
+                key = self.instances.annotation_id(i)
+                if key in self.cache:
+                    self.ready.put(i)
+                    continue
+                
+                try:
+                    # Probe with `in` so thumbnails that miss the decode cache
+                    # are not counted against its hit rate.
+                    img = None
+                    if self.decode_cache is not None and key in self.decode_cache:
+                        pyramid = self.decode_cache.get(key)
+                        if pyramid is not None:
+                            img = pyramid.level_for_zoom(
+                                self.size / max(pyramid.width, pyramid.height))
+                    if img is None:
+                        img = load_instance_image(self.instances[i], self.size)
+                    thumbnail = img.copy()
+                    thumbnail.thumbnail((self.size, self.size))
+                    self.cache.put(key, thumbnail)
+                    self.ready.put(i)
+                except Exception as e:
+                    self.failed.add(key)
+                    print(f"Error creating thumbnail for annotation {key}: {e}")
+
+
+class SessionJournal:
+    # Append-only JSONL log of review decisions. The first line is a header
+    # identifying the review queue; every following line is one decision and
+    # carries the running counts and the furthest position reached, so
+    # resuming only needs the last line.
+    
+    def __init__(self, path, sync_every=50, sync_interval=2.0):
+        self.path = Path(path)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.next_index = 0
+        self.file = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+    
+    @staticmethod
+    def make_header(categories, instances):
+        return {
+            'category_ids': [category['id'] for category in categories],
+            'instance_count': len(instances),
+            'first_annotation_id': instances.annotation_id(0) if instances else None,
+            'last_annotation_id': instances.annotation_id(-1) if instances else None
+        }
+    
+    def read_header(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+    
+    def read_tail(self):
+        # Read backwards from the end of the file so the cost does not depend
+        # on how many decisions have been logged. A last line torn by a crash
+        # between syncs is skipped in favour of the previous complete one;
+        # the returned offset is where that record's line ends.
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                position = size
+                chunk = b''
+                checked = 0
+                while position > 0:
+                    step = min(4096, position)
+                    position -= step
+                    f.seek(position)
+                    chunk = f.read(step) + chunk
+                    lines = chunk.split(b'\n')
+                    # The first piece may start before this chunk.
+                    first = 0 if position == 0 else 1
+                    for k in range(len(lines) - 1 - checked, first - 1, -1):
+                        checked += 1
+                        if not lines[k].strip():
+                            continue
+                        try:
+                            record = json.loads(lines[k])
+                        except ValueError:
+                            continue
+                        return record, size - len(b'\n'.join(lines[k + 1:]))
+        except OSError:
+            pass
+        return None, 0
+    
+    def read_last_record(self):
+        return self.read_tail()[0]
+    
+    def resume_state(self, header):
+        if self.read_header() != header:
+            return None
+        
+        last = self.read_last_record()
+        if last is None or 'next_index' not in last:
+            return None
+        return last
+    
+    def rotate(self):
+        # Starting over keeps the earlier decisions under a timestamped name
+        # instead of truncating them.
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        backup_path = self.path.with_name(f'{self.path.name}.{stamp}')
+        suffix = 1
+        while backup_path.exists():
+            backup_path = self.path.with_name(f'{self.path.name}.{stamp}-{suffix}')
+            suffix += 1
+        os.replace(self.path, backup_path)
+        return backup_path
+    
+    def open(self, header, resume=False):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume:
+            last, end = self.read_tail()
+            self.next_index = last.get('next_index', 0)
+            # Drop a torn last line so new records start on a line of their own.
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+                f.seek(end - 1)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            self.file = open(self.path, 'a')
+        else:
+            self.next_index = 0
+            if self.path.exists() and self.path.stat().st_size > 0:
+                self.rotate()
+            self.file = open(self.path, 'w')
+            self.write(header)
+            self.sync()
+    
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.file.flush()
+        self.unsynced += 1
+        
+        if (self.unsynced >= self.sync_every or
+                time.monotonic() - self.last_sync >= self.sync_interval):
+            self.sync()
+    
+    def sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+    
+    def record(self, index, annotation, decision, accepted_count, rejected_count):
+        # Going back to re-decide an instance must not move the resume point
+        # back with it.
+        self.next_index = max(self.next_index, index + 1)
+        record = {
+            'index': index,
+            'next_index': self.next_index,
+            'annotation_id': annotation['id'],
+            'decision': decision,
+            'accepted': accepted_count,
+            'rejected': rejected_count
+        }
+        if decision == 'reject':
+            record['annotation'] = annotation
+        self.write(record)
+    
+    def decisions(self):
+        with open(self.path, 'r') as f:
+            f.readline()
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'decision' in record:
+                    yield record
+    
+    def final_decisions(self):
+        # The last decision for an annotation wins, in case it was revisited
+        # after navigating back.
+        decisions = {}
+        for record in self.decisions():
+            decisions[record['annotation_id']] = record
+        return decisions
+    
+    def rejected_annotations(self):
+        return [record['annotation'] for record in self.final_decisions().values()
+                if record['decision'] == 'reject']
+    
+    def close(self, finished=False):
+        if self.file is None:
+            return
+        if finished:
+            self.file.write(json.dumps({'finished': True}) + '\n')
+            self.file.flush()
+        self.sync()
+        self.file.close()
+        self.file = None
+
+
+def shard_of(annotation_id, num_shards):
+    # crc32 rather than hash() so every reviewer's process agrees on the split.
+    return zlib.crc32(str(annotation_id).encode('utf-8')) % num_shards
+
+
+def select_shard(instances, shard_index, num_shards):
+    if num_shards <= 1:
+        return instances
+    return instances.subset(i for i in range(len(instances))
+                            if shard_of(instances.annotation_id(i), num_shards) == shard_index)
+
+
+def shard_journal_path(shared_dir, name, shard_index, num_shards):
+    if num_shards <= 1:
+        return Path(shared_dir) / f'session_{name}.jsonl'
+    return Path(shared_dir) / f'session_{name}.shard{shard_index + 1}of{num_shards}.jsonl'
+
+
+def claim_shard(shared_dir, name, shard_index, num_shards):
+    # Claims are plain files created with O_EXCL, which is atomic on local
+    # and network file systems alike, so no coordination server is needed.
+    Path(shared_dir).mkdir(parents=True, exist_ok=True)
+    claim_path = Path(shared_dir) / f'session_{name}.shard{shard_index + 1}of{num_shards}.claim'
+    owner = f"{os.environ.get('USER') or os.environ.get('USERNAME', 'unknown')}@{socket.gethostname()}"
+    
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        with open(claim_path, 'r') as f:
+            current_owner = f.read().strip()
+        return current_owner == owner, current_owner
+    
+    with os.fdopen(fd, 'w') as f:
+        f.write(owner)
+    return True, owner
+
+
+def load_images_subset(coco_path, image_ids, category_ids):
+    # Builds a COCOIndex holding only the images and categories a merge
+    # needs, streaming the file when ijson is available.
+    index = COCOIndex()
+    
+    if ijson is not None:
+        for prefix, item in stream_coco_items(coco_path, ('images.item', 'categories.item')):
+            if prefix == 'images.item':
+                if item['id'] in image_ids:
+                    index.add_image(item)
+            elif item['id'] in category_ids:
+                index.categories.append(item)
+    else:
+        with open(coco_path, 'r') as f:
+            coco_data = json.load(f)
+        for img in coco_data.get('images', []):
+            if img['id'] in image_ids:
+                index.add_image(img)
+        index.categories = [cat for cat in coco_data.get('categories', [])
+                            if cat['id'] in category_ids]
+        del coco_data
+    
+    return index
+
+
+def merge_shard_journals(shared_dir, coco_path, output_root='output', export_format='json'):
+    shard_pattern = re.compile(r'^session_(.+)\.shard(\d+)of(\d+)\.jsonl$')
+    sessions = {}
+    for path in sorted(Path(shared_dir).glob('session_*.shard*of*.jsonl')):
+        match = shard_pattern.match(path.name)
+        if match:
+            sessions.setdefault((match.group(1), int(match.group(3))), []).append(path)
+    
+    summaries = []
+    for (name, num_shards), paths in sessions.items():
+        decisions = {}
+        category_ids = set()
+        unfinished = []
+        for path in paths:
+            journal = SessionJournal(path)
+            header = journal.read_header() or {}
+            category_ids.update(header.get('category_ids', []))
+            if journal.read_last_record() != {'finished': True}:
+                unfinished.append(path.name)
+            decisions.update(journal.final_decisions())
+        
+        rejected = [record['annotation'] for record in decisions.values()
+                    if record['decision'] == 'reject']
+        image_ids = set(ann['image_id'] for ann in rejected)
+        subset = load_images_subset(coco_path, image_ids, category_ids)
+        output_paths = write_rejected_sets(output_root, rejected, subset.categories, subset,
+                                           export_format)
+        
+        summaries.append({
+            'name': name,
+            'shards_found': len(paths),
+            'num_shards': num_shards,
+            'unfinished': unfinished,
+            'decisions': len(decisions),
+            'rejected': len(rejected),
+            'output_paths': output_paths
+        })
+    
+    return summaries
 
 
 class COCOLabelReviewer:
@@ -14,14 +1804,19 @@ class COCOLabelReviewer:
         self.root.title("COCO Label Reviewer")
         self.root.geometry("1200x800")
         
-        self.coco_data = None
+        self.coco_index = None
+        self.duplicate_index = None
         self.coco_path = None
         self.images_dir = None
+        self.image_dir_index = None
         self.categories = []
-        self.selected_category = None
+        self.selected_categories = []
+        self.category_by_id = {}
+        self.category_offsets = {}
         self.cropped_instances = []
         self.current_index = 0
-        self.rejected_annotations = []
+        self.rejected_annotations = {}
+        self.decided = bytearray()
         
         self.current_image = None
         self.photo_image = None
@@ -33,12 +1828,43 @@ class COCOLabelReviewer:
         self.pan_start_x = 0
         self.pan_start_y = 0
         self.canvas_image_id = None
+        self.current_pyramid = None
+        self.rendered_region = None
+        self.overlay_cache = OverlayCache()
+        self.overlay_items = []
+        self.show_overlays = True
+        
+        self.decode_cache = DecodeCache()
+        self.thumbnail_cache = DecodeCache(max_bytes=128 * 1024 * 1024)
+        self.thumbnail_loader = None
+        self.grid_mode = False
+        self.perf_overlay = False
+        self.grid_marked = set()
+        self.grid_photos = {}
+        self.journal = None
+        self.redraw = None
+        self.prefetcher = None
         
         self.accepted_count = 0
         self.rejected_count = 0
         
         self.current_page = 1
         
+        self.processing_thread = None
+        self.processing_queue = None
+        self.write_crops = tk.BooleanVar(value=False)
+        self.export_format = tk.StringVar(value='json')
+        self.prioritize = tk.BooleanVar(value=False)
+        self.num_shards = tk.IntVar(value=1)
+        self.shard_number = tk.IntVar(value=1)
+        self.shared_dir = Path('output')
+        self.active_shard = (1, 0)
+        self.start_button = None
+        self.crop_format = tk.StringVar(value='source')
+        self.export_thread = None
+        self.export_status = None
+        self.export_progress = None
+        
         self.control_frame = None
         self.canvas_frame = None
         self.canvas = None
@@ -47,6 +1873,7 @@ class COCOLabelReviewer:
         self.stats_label = None
         self.filename_label = None
         self.zoom_label = None
+        self.frame_label = None
         
         self.setup_ui()
         self.show_page_1()
@@ -113,16 +1940,25 @@ class COCOLabelReviewer:
             return
         
         try:
-            with open(filepath, 'r') as f:
-                self.coco_data = json.load(f)
+            self.status_label.config(text="Loading annotations...")
+            self.root.update()
+            
+            self.coco_index = COCOIndex.load(filepath)
+            # Overlapping pairs for every category are found once, in the
+            # background, while the reviewer picks categories.
+            if self.duplicate_index is not None:
+                self.duplicate_index.stop()
+            self.duplicate_index = DuplicateIndex(self.coco_index)
+            threading.Thread(target=self.duplicate_index.build, daemon=True).start()
             
             self.coco_path = Path(filepath)
-            self.categories = self.coco_data.get('categories', [])
+            self.categories = self.coco_index.categories
+            self.category_by_id = {cat['id']: cat for cat in self.categories}
             
             self.json_label.config(text=f"{self.coco_path.name} ({len(self.categories)} categories)", 
                                   foreground='green')
-            self.status_label.config(text=f"✓ Loaded {len(self.coco_data.get('images', []))} images, "
-                                         f"{len(self.coco_data.get('annotations', []))} annotations")
+            self.status_label.config(text=f"✓ Loaded {self.coco_index.num_images} images, "
+                                         f"{self.coco_index.num_annotations} annotations")
             
             self.check_ready_for_next()
             
@@ -136,19 +1972,73 @@ class COCOLabelReviewer:
             return
         
         self.images_dir = Path(dirpath)
+        self.image_dir_index = None
+        self.dir_label.config(text=f"{self.images_dir.name} (scanning...)", foreground='gray')
         
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-        image_files = [f for f in self.images_dir.iterdir() 
-                      if f.is_file() and f.suffix.lower() in image_extensions]
+        scan_queue = queue.Queue()
         
-        self.dir_label.config(text=f"{self.images_dir.name} ({len(image_files)} images)", 
-                             foreground='green')
+        def scan(images_dir=self.images_dir, coco_index=self.coco_index):
+            # Missing files are counted here too: file names with a
+            # subdirectory scan that subdirectory on first lookup.
+            try:
+                index = ImageDirIndex.for_directory(images_dir)
+                missing = index.missing_images(coco_index.images) if coco_index else None
+                scan_queue.put((index, coco_index, missing))
+            except Exception as e:
+                scan_queue.put(e)
+        
+        threading.Thread(target=scan, daemon=True).start()
+        self.root.after(100, self.poll_dir_scan, self.images_dir, scan_queue)
         
         self.check_ready_for_next()
     
+    def poll_dir_scan(self, images_dir, scan_queue):
+        if self.current_page != 1 or images_dir != self.images_dir:
+            return
+        
+        try:
+            result = scan_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_dir_scan, images_dir, scan_queue)
+            return
+        
+        if isinstance(result, Exception):
+            self.dir_label.config(text=f"{images_dir.name} (scan failed)", foreground='red')
+            messagebox.showerror("Error", f"Failed to scan images directory:\n{str(result)}")
+            return
+        
+        index, coco_index, missing = result
+        self.image_dir_index = index
+        self.dir_label.config(text=f"{images_dir.name} ({index.image_count()} images)", 
+                             foreground='green')
+        if coco_index is not None and coco_index is self.coco_index:
+            self.next_button.config(state='normal')
+            self.show_missing_images(coco_index, index, missing)
+        else:
+            self.check_ready_for_next()
+    
     def check_ready_for_next(self):
-        if self.coco_data and self.images_dir:
+        if self.coco_index and self.images_dir:
             self.next_button.config(state='normal')
+            
+            if self.image_dir_index is not None:
+                coco_index = self.coco_index
+                dir_index = self.image_dir_index
+                self.run_in_background(
+                    lambda: dir_index.missing_images(coco_index.images),
+                    lambda missing: self.show_missing_images(coco_index, dir_index, missing),
+                    "Failed to check for missing images")
+    
+    def show_missing_images(self, coco_index, dir_index, missing):
+        if (self.current_page != 1 or coco_index is not self.coco_index or
+                dir_index is not self.image_dir_index):
+            return
+        if missing:
+            self.status_label.config(
+                text=f"✓ Loaded {coco_index.num_images} images, "
+                     f"{coco_index.num_annotations} annotations "
+                     f"({len(missing)} images missing from {self.images_dir.name})"
+            )
     
     def go_to_page_2(self):
         self.show_page_2()
@@ -157,7 +2047,7 @@ class COCOLabelReviewer:
         self.clear_content()
         self.current_page = 2
         
-        title = ttk.Label(self.content_frame, text="Select Category to Review", 
+        title = ttk.Label(self.content_frame, text="Select Categories to Review", 
                          font=('Arial', 20, 'bold'))
         title.pack(pady=20)
         
@@ -171,118 +2061,426 @@ class COCOLabelReviewer:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         self.category_listbox = tk.Listbox(list_frame, yscrollcommand=scrollbar.set,
-                                          font=('Arial', 12), height=20)
+                                          font=('Arial', 12), height=20,
+                                          selectmode=tk.EXTENDED)
         self.category_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.config(command=self.category_listbox.yview)
         
-        annotations = self.coco_data.get('annotations', [])
-        category_counts = {}
-        for ann in annotations:
-            cat_id = ann['category_id']
-            category_counts[cat_id] = category_counts.get(cat_id, 0) + 1
-        
         for cat in self.categories:
-            count = category_counts.get(cat['id'], 0)
+            count = self.coco_index.category_count(cat['id'])
             self.category_listbox.insert(tk.END, 
                                         f"{cat['name']} ({count} instances)")
         
-        ttk.Button(self.content_frame, text="Process Selected Category", 
-                  command=self.process_category).pack(pady=20)
+        options_frame = ttk.Frame(self.content_frame)
+        options_frame.pack(pady=(10, 0))
+        
+        ttk.Checkbutton(options_frame, text="Export crop files to output/",
+                       variable=self.write_crops).pack(side=tk.LEFT, padx=10)
+        ttk.Label(options_frame, text="Crop format:").pack(side=tk.LEFT, padx=(10, 5))
+        ttk.Combobox(options_frame, textvariable=self.crop_format, state='readonly',
+                    values=['source'] + sorted(CROP_FORMATS), width=9).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text="Review suspicious boxes first",
+                       variable=self.prioritize).pack(side=tk.LEFT, padx=10)
+        
+        ttk.Label(options_frame, text="Rejected set format:").pack(side=tk.LEFT, padx=(10, 5))
+        ttk.Combobox(options_frame, textvariable=self.export_format, state='readonly',
+                    values=sorted(EXPORT_FORMATS), width=8).pack(side=tk.LEFT)
+        
+        shard_frame = ttk.Frame(self.content_frame)
+        shard_frame.pack(pady=(10, 0))
+        
+        ttk.Label(shard_frame, text="Reviewers:").pack(side=tk.LEFT, padx=(10, 5))
+        ttk.Spinbox(shard_frame, from_=1, to=256, width=4,
+                   textvariable=self.num_shards).pack(side=tk.LEFT)
+        ttk.Label(shard_frame, text="My shard:").pack(side=tk.LEFT, padx=(10, 5))
+        ttk.Spinbox(shard_frame, from_=1, to=256, width=4,
+                   textvariable=self.shard_number).pack(side=tk.LEFT)
+        ttk.Button(shard_frame, text="Shared Folder...",
+                  command=self.select_shared_dir).pack(side=tk.LEFT, padx=(10, 5))
+        self.shared_dir_label = ttk.Label(shard_frame, text=str(self.shared_dir), foreground='gray')
+        self.shared_dir_label.pack(side=tk.LEFT, padx=5)
+        ttk.Button(shard_frame, text="Merge Shards",
+                  command=self.merge_shards).pack(side=tk.LEFT, padx=(10, 5))
+        
+        button_frame = ttk.Frame(self.content_frame)
+        button_frame.pack(pady=20)
+        
+        self.process_button = ttk.Button(button_frame, text="Process Selected Categories", 
+                                        command=self.process_category)
+        self.process_button.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(button_frame, text="Load Cached Crops", 
+                  command=self.load_cached_crops).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(button_frame, text="Reject Duplicates", 
+                  command=self.reject_duplicates).pack(side=tk.LEFT, padx=5)
         
         self.process_status = ttk.Label(self.content_frame, text="", 
                                        foreground='blue')
         self.process_status.pack(pady=10)
+        
+        self.export_status = ttk.Label(self.content_frame, text="", foreground='blue')
+        self.export_status.pack()
+        self.export_progress = ttk.Progressbar(self.content_frame, mode='determinate', length=300)
+        if self.export_thread is not None and self.export_thread.is_alive():
+            self.export_status.config(text="Saving rejected annotations...")
+            self.export_progress.pack(pady=5)
+        
+        if self.processing_thread is not None and self.processing_thread.is_alive():
+            self.process_button.config(state='disabled')
+            self.process_status.config(text=f"Processing {self.selection_name()}...")
+            self.root.after(100, self.poll_processing)
     
     def process_category(self):
+        if self.processing_thread is not None and self.processing_thread.is_alive():
+            return
+        
+        selection = self.category_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a category first")
+            return
+        
+        categories = [self.categories[idx] for idx in selection]
+        write_crops = self.write_crops.get()
+        crop_format = None if self.crop_format.get() == 'source' else self.crop_format.get()
+        
+        self.start_processing(categories, lambda report: extract_categories_crops(
+            self.coco_index, categories, self.images_dir, progress_callback=report,
+            write_crops=write_crops, crop_format=crop_format))
+    
+    def start_processing(self, categories, load_instances):
+        self.selected_categories = categories
+        self.process_status.config(text=f"Processing {self.selection_name()}...")
+        self.process_button.config(state='disabled')
+        
+        self.cropped_instances = []
+        self.processing_queue = queue.Queue()
+        self.processing_thread = threading.Thread(
+            target=self.run_processing,
+            args=(load_instances, self.processing_queue, self.prioritize.get()),
+            daemon=True
+        )
+        self.processing_thread.start()
+        self.root.after(100, self.poll_processing)
+    
+    def load_cached_crops(self):
+        if self.processing_thread is not None and self.processing_thread.is_alive():
+            return
+        
         selection = self.category_listbox.curselection()
         if not selection:
             messagebox.showwarning("Warning", "Please select a category first")
             return
         
-        idx = selection[0]
-        self.selected_category = self.categories[idx]
+        categories = [self.categories[idx] for idx in selection]
+        manifests = []
+        for category in categories:
+            manifest = CropManifest(Path('output') / category['name'])
+            if not manifest.exists():
+                messagebox.showwarning("Warning", f"No cached crops found for {category['name']}.\n"
+                                                  f"Process the category with crop export enabled first.")
+                return
+            manifests.append((category, manifest))
+        
+        def load_instances(report):
+            instances = InstanceStore(self.coco_index, self.images_dir)
+            for category, manifest in manifests:
+                manifest.load().load_into(instances, category['id'])
+            return instances
+        
+        self.start_processing(categories, load_instances)
+    
+    def reject_duplicates(self):
+        selection = self.category_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a category first")
+            return
         
-        self.process_status.config(text=f"Processing {self.selected_category['name']}...")
-        self.root.update()
+        categories = [self.categories[idx] for idx in selection]
+        category_ids = [category['id'] for category in categories]
+        self.process_status.config(text="Finding duplicate boxes...")
+        self.run_in_background(lambda: self.duplicate_index.duplicate_annotations(category_ids),
+                               lambda rejected: self.confirm_duplicates(categories, rejected),
+                               "Failed to find duplicates")
+    
+    def confirm_duplicates(self, categories, rejected):
+        if self.current_page == 2:
+            self.process_status.config(text="")
         
-        category_id = self.selected_category['id']
-        annotations = [ann for ann in self.coco_data.get('annotations', [])
-                      if ann['category_id'] == category_id]
+        names = ', '.join(category['name'] for category in categories)
+        if not rejected:
+            messagebox.showinfo("Duplicates", f"No duplicate boxes found in {names}.")
+            return
         
-        output_dir = Path('output') / self.selected_category['name']
-        output_dir.mkdir(parents=True, exist_ok=True)
+        if not messagebox.askyesno("Reject Duplicates",
+                                   f"Found {len(rejected)} boxes in {names} overlapping an "
+                                   f"earlier box of the same category with IoU above "
+                                   f"{DUPLICATE_IOU}.\n\nReject them all?"):
+            return
         
-        self.cropped_instances = []
-        images_dict = {img['id']: img for img in self.coco_data.get('images', [])}
+        export_format = self.export_format.get()
+        self.run_in_background(
+            lambda: write_rejected_sets(Path('output') / 'duplicates', rejected, categories,
+                                        self.coco_index, export_format),
+            lambda output_paths: messagebox.showinfo(
+                "Duplicates Rejected",
+                "Rejected annotations saved to:\n" + "\n".join(str(path) for path in output_paths)),
+            "Failed to save rejected duplicates")
+    
+    def run_in_background(self, work, on_done, error_message):
+        # Runs work() on a daemon thread and hands its result to on_done on
+        # the Tk thread.
+        result_queue = queue.Queue()
         
-        for ann in annotations:
-            image_info = images_dict.get(ann['image_id'])
-            if not image_info:
-                continue
-            
-            image_path = self.images_dir / image_info['file_name']
-            if not image_path.exists():
-                continue
-            
+        def run():
             try:
-                img = Image.open(image_path)
-                bbox = ann['bbox']
-                x, y, w, h = bbox
-                
-                padding = 10
-                x1 = max(0, int(x - padding))
-                y1 = max(0, int(y - padding))
-                x2 = min(img.width, int(x + w + padding))
-                y2 = min(img.height, int(y + h + padding))
-                
-                cropped = img.crop((x1, y1, x2, y2))
-                
-                crop_filename = f"{ann['id']}_{image_info['file_name']}"
-                crop_path = output_dir / crop_filename
-                cropped.save(crop_path)
-                
-                self.cropped_instances.append({
-                    'path': crop_path,
-                    'annotation': ann,
-                    'image_info': image_info,
-                    'original_image': image_path
-                })
-                
+                result_queue.put(('done', work()))
             except Exception as e:
-                print(f"Error processing annotation {ann['id']}: {e}")
+                result_queue.put(('error', e))
+        
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(100, self.poll_background, result_queue, on_done, error_message)
+    
+    def poll_background(self, result_queue, on_done, error_message):
+        try:
+            status, value = result_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_background, result_queue, on_done, error_message)
+            return
+        
+        if status == 'error':
+            messagebox.showerror("Error", f"{error_message}:\n{str(value)}")
+        else:
+            on_done(value)
+    
+    def select_shared_dir(self):
+        dirpath = filedialog.askdirectory(title="Select Shared Folder for Shard Journals")
+        if not dirpath:
+            return
+        self.shared_dir = Path(dirpath)
+        self.shared_dir_label.config(text=str(self.shared_dir))
+    
+    def shard_settings(self):
+        try:
+            num_shards = max(1, self.num_shards.get())
+            shard_index = min(max(1, self.shard_number.get()), num_shards) - 1
+        except tk.TclError:
+            return 1, 0
+        return num_shards, shard_index
+    
+    def merge_shards(self):
+        # Merging streams the whole COCO file for image records, so it runs
+        # off the Tk thread.
+        export_format = self.export_format.get()
+        self.process_status.config(text="Merging shard journals...")
+        self.run_in_background(
+            lambda: merge_shard_journals(self.shared_dir, self.coco_path, 'output', export_format),
+            self.show_merge_summary, "Failed to merge shards")
+    
+    def show_merge_summary(self, summaries):
+        if self.current_page == 2:
+            self.process_status.config(text="")
+        
+        if not summaries:
+            messagebox.showinfo("Merge Shards", f"No shard journals found in {self.shared_dir}")
+            return
+        
+        lines = []
+        for summary in summaries:
+            lines.append(f"{summary['name']}: {summary['shards_found']}/{summary['num_shards']} "
+                         f"shards, {summary['decisions']} decisions, "
+                         f"{summary['rejected']} rejected")
+            if summary['unfinished']:
+                lines.append(f"  still in progress: {', '.join(summary['unfinished'])}")
+            lines.extend(f"  {path}" for path in summary['output_paths'])
+        messagebox.showinfo("Merge Shards", "\n".join(lines))
+    
+    def selection_name(self):
+        return '+'.join(category['name'] for category in self.selected_categories)
+    
+    def session_name(self):
+        # Journal and claim file names. Joining many category names would
+        # exceed the file name limit, so a multi-category selection is named
+        # by a hash of its sorted category ids instead.
+        if len(self.selected_categories) == 1:
+            return self.selected_categories[0]['name']
+        ids = ','.join(str(category_id) for category_id in
+                       sorted(category['id'] for category in self.selected_categories))
+        return 'multi-' + hashlib.sha1(ids.encode('utf-8')).hexdigest()[:12]
+    
+    def run_processing(self, load_instances, progress_queue, prioritize=False):
+        def report(done, total):
+            progress_queue.put(('progress', done, total))
+        
+        try:
+            instances = load_instances(report)
+            if prioritize:
+                # Scoring walks every box of the selected categories, so it
+                # stays on this thread rather than in finish_processing.
+                progress_queue.put(('status', "Sorting by suspiciousness..."))
+                instances = prioritize_instances(instances, self.duplicate_index)
+            progress_queue.put(('done', instances))
+        except Exception as e:
+            progress_queue.put(('error', e))
+    
+    def poll_processing(self):
+        if self.current_page != 2:
+            return
+        
+        try:
+            while True:
+                message = self.processing_queue.get_nowait()
+                
+                if message[0] == 'progress':
+                    _, done, total = message
+                    self.process_status.config(
+                        text=f"Processing {self.selection_name()}... "
+                             f"{done}/{total} images"
+                    )
+                elif message[0] == 'status':
+                    self.process_status.config(text=message[1])
+                elif message[0] == 'done':
+                    self.finish_processing(message[1])
+                    return
+                elif message[0] == 'error':
+                    self.process_button.config(state='normal')
+                    self.process_status.config(text="")
+                    messagebox.showerror("Error", f"Failed to process category:\n{str(message[1])}")
+                    return
+        except queue.Empty:
+            pass
+        
+        self.root.after(100, self.poll_processing)
+    
+    def finish_processing(self, instances):
+        self.active_shard = self.shard_settings()
+        num_shards, shard_index = self.active_shard
+        self.cropped_instances = select_shard(instances, shard_index, num_shards)
+        self.decode_cache.clear()
+        self.thumbnail_cache.clear()
+        self.overlay_cache.clear()
+        self.process_button.config(state='normal')
         
         self.process_status.config(
             text=f"✓ Processed {len(self.cropped_instances)} instances. Click 'Start Review' to begin.",
             foreground='green'
         )
         
-        ttk.Button(self.content_frame, text="Start Review →", 
-                  command=self.show_page_3).pack(pady=20)
+        if self.start_button is None or not self.start_button.winfo_exists():
+            self.start_button = ttk.Button(self.content_frame, text="Start Review →", 
+                                          command=self.show_page_3)
+            self.start_button.pack(pady=20)
     
     def show_page_3(self):
         if not self.cropped_instances:
             messagebox.showwarning("Warning", "No instances to review")
             return
         
-        self.clear_content()
-        self.current_page = 3
         self.current_index = 0
         self.accepted_count = 0
         self.rejected_count = 0
-        self.rejected_annotations = []
+        self.rejected_annotations = {}
+        self.decided = bytearray(len(self.cropped_instances))
+        
+        if not self.start_session():
+            return
+        
+        self.clear_content()
+        self.current_page = 3
+        
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+        self.prefetcher = InstancePrefetcher(self.cropped_instances, self.decode_cache)
+        
+        if self.thumbnail_loader is not None:
+            self.thumbnail_loader.stop()
+        self.thumbnail_loader = ThumbnailLoader(self.cropped_instances, self.thumbnail_cache,
+                                                self.decode_cache)
+        self.grid_mode = False
+        
+        # The queue is grouped by category; remember where each group starts
+        # so the reviewer can switch categories without re-processing.
+        self.category_offsets = {}
+        for i in range(len(self.cropped_instances)):
+            self.category_offsets.setdefault(self.cropped_instances.category_id(i), i)
         
         self.setup_review_ui()
         self.bind_review_events()
         self.load_current_instance()
     
+    def start_session(self):
+        num_shards, shard_index = self.active_shard
+        journal = SessionJournal(shard_journal_path(self.shared_dir, self.session_name(),
+                                                    shard_index, num_shards))
+        header = SessionJournal.make_header(self.selected_categories, self.cropped_instances)
+        state = journal.resume_state(header)
+        
+        if num_shards > 1:
+            claimed, owner = claim_shard(self.shared_dir, self.session_name(),
+                                         shard_index, num_shards)
+            if not claimed and not messagebox.askyesno(
+                    "Shard Claimed",
+                    f"Shard {shard_index + 1} of {num_shards} is already claimed by "
+                    f"{owner}.\nTwo reviewers on one shard write to the same journal.\n\n"
+                    f"Review it anyway?"):
+                return False
+            
+            # A shard journal is the only copy of that shard's decisions the
+            # merge sees, so it is always continued and never started over.
+            # One holding only its header has no decisions yet and continues
+            # from the start.
+            existing_header = journal.read_header()
+            if state is None and existing_header is not None:
+                if existing_header != header:
+                    messagebox.showerror("Shard Journal",
+                                         f"{journal.path} was written for a different queue "
+                                         f"and is left untouched.\nCheck the selected "
+                                         f"categories and shard settings.")
+                    return False
+                if journal.read_last_record() == {'finished': True}:
+                    messagebox.showinfo("Shard Finished",
+                                        f"Shard {shard_index + 1} of {num_shards} has already "
+                                        f"been reviewed to the end.")
+                    return False
+            resume = existing_header is not None
+        else:
+            if state is not None and not messagebox.askyesno(
+                    "Resume Session",
+                    f"A previous review of {self.selection_name()} stopped at "
+                    f"instance {state['next_index'] + 1} of {len(self.cropped_instances)}.\n\n"
+                    f"Resume where you left off?"):
+                state = None
+            resume = state is not None
+        
+        if state is not None:
+            self.current_index = state['next_index']
+            self.accepted_count = state['accepted']
+            self.rejected_count = state['rejected']
+            for record in journal.final_decisions().values():
+                self.decided[record['index']] = DECISION_CODES[record['decision']]
+                if record['decision'] == 'reject':
+                    self.rejected_annotations[record['annotation_id']] = record['annotation']
+        
+        journal.open(header, resume=resume)
+        self.journal = journal
+        return True
+    
     def setup_review_ui(self):
         self.control_frame = ttk.Frame(self.content_frame)
         self.control_frame.pack(fill=tk.X, padx=5, pady=5)
         
-        cat_label = ttk.Label(self.control_frame, 
-                             text=f"Reviewing: {self.selected_category['name']}",
-                             font=('Arial', 12, 'bold'))
-        cat_label.pack(side=tk.LEFT, padx=10)
+        self.category_label = ttk.Label(self.control_frame, text="Reviewing:",
+                                       font=('Arial', 12, 'bold'))
+        self.category_label.pack(side=tk.LEFT, padx=10)
+        
+        if len(self.category_offsets) > 1:
+            self.jump_category = tk.StringVar()
+            jump_box = ttk.Combobox(self.control_frame, textvariable=self.jump_category,
+                                    state='readonly', width=16,
+                                    values=[self.category_by_id[cat_id]['name']
+                                            for cat_id in self.category_offsets])
+            jump_box.pack(side=tk.LEFT)
+            jump_box.bind('<<ComboboxSelected>>', self.jump_to_category)
         
         ttk.Label(self.control_frame, text="Zoom:").pack(side=tk.LEFT, padx=(20, 5))
         ttk.Button(self.control_frame, text="-", width=3, 
@@ -296,6 +2494,13 @@ class COCOLabelReviewer:
         ttk.Button(self.control_frame, text="100%", width=5, 
                   command=self.reset_zoom).pack(side=tk.LEFT)
         
+        self.grid_button = ttk.Button(self.control_frame, text="Grid View", width=10,
+                                     command=self.toggle_grid_mode)
+        self.grid_button.pack(side=tk.LEFT, padx=(20, 5))
+        
+        self.frame_label = ttk.Label(self.control_frame, text="", foreground='gray')
+        self.frame_label.pack(side=tk.RIGHT, padx=10)
+        
         self.canvas_frame = ttk.Frame(self.content_frame)
         self.canvas_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
@@ -303,6 +2508,8 @@ class COCOLabelReviewer:
                                highlightthickness=0)
         self.canvas.pack(fill=tk.BOTH, expand=True)
         
+        self.redraw = RedrawScheduler(self.root, self.display_image)
+        
         self.status_frame = ttk.Frame(self.content_frame)
         self.status_frame.pack(fill=tk.X, padx=5, pady=5)
         
@@ -315,12 +2522,22 @@ class COCOLabelReviewer:
         self.filename_label = ttk.Label(self.status_frame, text="")
         self.filename_label.pack(side=tk.RIGHT, padx=5)
         
+        self.perf_label = ttk.Label(self.content_frame, text="", foreground='gray',
+                                   font=('Courier', 9))
+        
         self.instructions_frame = ttk.Frame(self.content_frame)
         self.instructions_frame.pack(fill=tk.X, padx=5, pady=5)
         
-        instructions = "Enter: Accept | Backspace: Reject | Arrow Keys: Navigate | Mouse Wheel: Zoom | Drag: Pan | Esc: Finish"
-        ttk.Label(self.instructions_frame, text=instructions, 
-                 foreground='gray').pack()
+        self.instructions_label = ttk.Label(self.instructions_frame, text=self.review_instructions(), 
+                                           foreground='gray')
+        self.instructions_label.pack()
+    
+    def review_instructions(self):
+        if self.grid_mode:
+            return ("Click: Mark/Unmark Reject | Enter: Accept Unmarked, Reject Marked | "
+                    "Arrow Keys: Change Page | G: Single View | F2: Perf | Esc: Finish")
+        return ("Enter: Accept | Backspace: Reject | Arrow Keys: Navigate | Mouse Wheel: Zoom | "
+                "Drag: Pan | O: Overlays | G: Grid View | F2: Perf | F3: Dump Perf | Esc: Finish")
     
     def bind_review_events(self):
         self.root.bind('<Return>', self.accept_instance)
@@ -330,6 +2547,10 @@ class COCOLabelReviewer:
         self.root.bind('<Up>', self.prev_instance)
         self.root.bind('<Down>', self.next_instance)
         self.root.bind('<Escape>', self.finish_review)
+        self.root.bind('<g>', self.toggle_grid_mode)
+        self.root.bind('<o>', self.toggle_overlays)
+        self.root.bind('<F2>', self.toggle_perf_overlay)
+        self.root.bind('<F3>', self.dump_perf_stats)
         
         self.canvas.bind('<ButtonPress-1>', self.start_pan)
         self.canvas.bind('<B1-Motion>', self.do_pan)
@@ -349,28 +2570,69 @@ class COCOLabelReviewer:
         instance = self.cropped_instances[self.current_index]
         
         try:
-            self.current_image = Image.open(instance['path'])
+            self.current_pyramid = self.get_instance_pyramid(instance)
+            self.current_image = self.current_pyramid.levels[0]
+            self.prefetcher.request(self.current_index)
+            self.create_overlays(instance)
             self.fit_to_window()
             self.update_status()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load image:\n{str(e)}")
             self.next_instance_internal()
     
-    def display_image(self):
-        if self.current_image is None:
-            return
-        
-        new_width = int(self.current_image.width * self.zoom_level)
-        new_height = int(self.current_image.height * self.zoom_level)
-        
-        if new_width < 1 or new_height < 1:
-            return
-        
-        resized = self.current_image.resize((new_width, new_height), 
-                                           Image.Resampling.LANCZOS)
-        self.photo_image = ImageTk.PhotoImage(resized)
-        
+    def get_instance_pyramid(self, instance):
+        key = instance['annotation']['id']
+        pyramid = self.decode_cache.get(key)
+        if pyramid is None:
+            img = load_instance_image(instance)
+            with perf.timer('decode'):
+                img.load()
+            pyramid = ImagePyramid(img)
+            self.decode_cache.put(key, pyramid)
+        return pyramid
+    
+    def create_overlays(self, instance):
+        # Overlays are canvas vector items created once per instance; zoom
+        # and pan only rewrite their coordinates.
         self.canvas.delete("all")
+        self.overlay_items = []
+        self.rendered_region = None
+        
+        shapes = self.overlay_cache.get(instance['annotation'], self.current_image.size)
+        state = 'normal' if self.show_overlays else 'hidden'
+        
+        for rect in shapes['mask_rects']:
+            item = self.canvas.create_rectangle(0, 0, 0, 0, fill='#00c8ff', outline='',
+                                               stipple='gray25', state=state,
+                                               tags='overlay')
+            self.overlay_items.append((item, rect))
+        
+        for polygon in shapes['polygons']:
+            item = self.canvas.create_polygon(0, 0, 0, 0, 0, 0, fill='', outline='#00c8ff',
+                                             width=2, state=state, tags='overlay')
+            self.overlay_items.append((item, polygon))
+        
+        item = self.canvas.create_rectangle(0, 0, 0, 0, outline='#ffcc00', width=2,
+                                           dash=(6, 4), state=state, tags='overlay')
+        self.overlay_items.append((item, shapes['bbox']))
+    
+    def update_overlays(self):
+        left, top, _, _ = self.image_canvas_rect()
+        zoom = self.zoom_level
+        for item, coords in self.overlay_items:
+            self.canvas.coords(item, *[(left if i % 2 == 0 else top) + value * zoom
+                                       for i, value in enumerate(coords)])
+        self.canvas.tag_raise('overlay')
+    
+    def toggle_overlays(self, event=None):
+        if self.grid_mode:
+            return
+        self.show_overlays = not self.show_overlays
+        self.canvas.itemconfigure('overlay', state='normal' if self.show_overlays else 'hidden')
+    
+    def image_canvas_rect(self):
+        new_width = self.current_image.width * self.zoom_level
+        new_height = self.current_image.height * self.zoom_level
         
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
@@ -385,11 +2647,53 @@ class COCOLabelReviewer:
         else:
             y = canvas_height // 2 + self.image_offset_y
         
-        self.canvas_image_id = self.canvas.create_image(
-            x, y, image=self.photo_image, anchor=tk.CENTER
-        )
+        return (x - new_width / 2, y - new_height / 2,
+                x + new_width / 2, y + new_height / 2)
+    
+    def visible_canvas_rect(self, margin=0):
+        left, top, right, bottom = self.image_canvas_rect()
+        return (max(left, -margin), max(top, -margin),
+                min(right, self.canvas.winfo_width() + margin),
+                min(bottom, self.canvas.winfo_height() + margin))
+    
+    def display_image(self, resample=None):
+        if self.current_image is None or self.grid_mode:
+            return
+        
+        if (int(self.current_image.width * self.zoom_level) < 1 or
+                int(self.current_image.height * self.zoom_level) < 1):
+            return
+        
+        # Only the part of the image on screen (plus a margin for panning) is
+        # resampled, from the pyramid level closest to the zoom.
+        left, top, _, _ = self.image_canvas_rect()
+        vx1, vy1, vx2, vy2 = self.visible_canvas_rect(RENDER_MARGIN)
+        render_width = int(round(vx2 - vx1))
+        render_height = int(round(vy2 - vy1))
+        
+        self.canvas.delete('image')
+        self.rendered_region = None
+        
+        if render_width >= 1 and render_height >= 1:
+            region = ((vx1 - left) / self.zoom_level, (vy1 - top) / self.zoom_level,
+                      (vx2 - left) / self.zoom_level, (vy2 - top) / self.zoom_level)
+            rendered = self.current_pyramid.render(self.zoom_level, region,
+                                                   (render_width, render_height),
+                                                   resample)
+            with perf.timer('photoimage'):
+                self.photo_image = ImageTk.PhotoImage(rendered)
+            
+            self.canvas_image_id = self.canvas.create_image(
+                vx1, vy1, image=self.photo_image, anchor=tk.NW, tags='image'
+            )
+            self.rendered_region = (vx1, vy1, vx1 + render_width, vy1 + render_height)
+        
+        self.update_overlays()
         
         self.zoom_label.config(text=f"{int(self.zoom_level * 100)}%")
+        if self.redraw.frame_count:
+            self.frame_label.config(text=f"Frame: {self.redraw.last_frame_ms:.1f} ms "
+                                         f"(max {self.redraw.max_frame_ms:.1f} ms)")
     
     def fit_to_window(self, event=None):
         if self.current_image is None:
@@ -426,18 +2730,25 @@ class COCOLabelReviewer:
         self.display_image()
     
     def mouse_wheel_zoom(self, event):
+        if self.grid_mode:
+            return
         if event.num == 5 or event.delta < 0:
             self.zoom_level = max(self.zoom_level / 1.1, self.min_zoom)
         else:
             self.zoom_level = min(self.zoom_level * 1.1, self.max_zoom)
-        self.display_image()
+        self.redraw.request()
     
     def start_pan(self, event):
+        if self.grid_mode:
+            self.grid_click(event)
+            return
         self.pan_start_x = event.x
         self.pan_start_y = event.y
         self.canvas.config(cursor='fleur')
     
     def do_pan(self, event):
+        if self.grid_mode:
+            return
         dx = event.x - self.pan_start_x
         dy = event.y - self.pan_start_y
         
@@ -447,30 +2758,267 @@ class COCOLabelReviewer:
         self.pan_start_x = event.x
         self.pan_start_y = event.y
         
-        self.display_image()
+        if self.current_image is None or self.rendered_region is None:
+            self.redraw.request()
+            return
+        
+        # Axes smaller than the canvas stay centered, so only move along the
+        # axes where the image overflows.
+        if self.current_image.width * self.zoom_level < self.canvas.winfo_width():
+            dx = 0
+        if self.current_image.height * self.zoom_level < self.canvas.winfo_height():
+            dy = 0
+        
+        self.canvas.move(self.canvas_image_id, dx, dy)
+        self.canvas.move('overlay', dx, dy)
+        rx1, ry1, rx2, ry2 = self.rendered_region
+        self.rendered_region = (rx1 + dx, ry1 + dy, rx2 + dx, ry2 + dy)
+        
+        # Re-render only once the pre-rendered margin no longer covers the view.
+        vx1, vy1, vx2, vy2 = self.visible_canvas_rect()
+        rx1, ry1, rx2, ry2 = self.rendered_region
+        if vx1 < rx1 - 1 or vy1 < ry1 - 1 or vx2 > rx2 + 1 or vy2 > ry2 + 1:
+            self.redraw.request()
     
     def end_pan(self, event):
         self.canvas.config(cursor='')
     
     def on_canvas_resize(self, event):
-        if self.current_image is not None:
-            self.display_image()
+        if self.grid_mode:
+            self.show_grid_page()
+        elif self.current_image is not None:
+            self.redraw.request()
+    
+    def jump_to_category(self, event=None):
+        name = self.jump_category.get()
+        for cat_id, offset in self.category_offsets.items():
+            if self.category_by_id[cat_id]['name'] == name:
+                self.current_index = offset
+                break
+        
+        self.canvas.focus_set()
+        if self.grid_mode:
+            self.grid_marked = set()
+            self.show_grid_page()
+        else:
+            self.image_offset_x = 0
+            self.image_offset_y = 0
+            self.load_current_instance()
+    
+    def toggle_grid_mode(self, event=None):
+        self.grid_mode = not self.grid_mode
+        self.redraw.cancel()
+        self.grid_button.config(text="Single View" if self.grid_mode else "Grid View")
+        self.instructions_label.config(text=self.review_instructions())
+        
+        if self.grid_mode:
+            self.grid_marked = set()
+            self.show_grid_page()
+            self.root.after(50, self.poll_thumbnails)
+        else:
+            self.grid_photos = {}
+            self.load_current_instance()
+    
+    def grid_page_indices(self):
+        end = min(self.current_index + GRID_COLUMNS * GRID_ROWS, len(self.cropped_instances))
+        return range(self.current_index, end)
+    
+    def grid_tile_rect(self, slot):
+        tile_width = self.canvas.winfo_width() / GRID_COLUMNS
+        tile_height = self.canvas.winfo_height() / GRID_ROWS
+        row, col = divmod(slot, GRID_COLUMNS)
+        return (col * tile_width, row * tile_height,
+                (col + 1) * tile_width, (row + 1) * tile_height)
+    
+    def show_grid_page(self):
+        if self.current_index >= len(self.cropped_instances):
+            self.finish_review()
+            return
+        
+        self.canvas.delete("all")
+        self.grid_photos = {}
+        self.current_image = None
+        
+        indices = self.grid_page_indices()
+        for slot, index in enumerate(indices):
+            self.draw_grid_tile(slot, index)
+        
+        # Thumbnails for this page first, then the next page in the background.
+        next_page = range(indices.stop, min(indices.stop + len(indices), len(self.cropped_instances)))
+        self.thumbnail_loader.request(list(indices) + list(next_page))
+        self.update_status()
+    
+    def draw_grid_tile(self, slot, index):
+        x1, y1, x2, y2 = self.grid_tile_rect(slot)
+        tag = f"tile{slot}"
+        self.canvas.delete(tag)
+        
+        thumbnail = self.thumbnail_cache.get(self.cropped_instances.annotation_id(index))
+        if thumbnail is not None:
+            max_width = max(1, int(x2 - x1) - 8)
+            max_height = max(1, int(y2 - y1) - 8)
+            if thumbnail.width > max_width or thumbnail.height > max_height:
+                thumbnail = thumbnail.copy()
+                thumbnail.thumbnail((max_width, max_height))
+            self.grid_photos[slot] = ImageTk.PhotoImage(thumbnail)
+            self.canvas.create_image((x1 + x2) / 2, (y1 + y2) / 2,
+                                    image=self.grid_photos[slot], tags=tag)
+        else:
+            self.canvas.create_rectangle(x1 + 4, y1 + 4, x2 - 4, y2 - 4,
+                                        fill='#3a3a3a', outline='', tags=tag)
+        
+        marked = index in self.grid_marked
+        self.canvas.create_rectangle(x1 + 2, y1 + 2, x2 - 2, y2 - 2,
+                                    outline='#ff4040' if marked else '#555555',
+                                    width=4 if marked else 1, tags=tag)
+    
+    def poll_thumbnails(self):
+        if not self.grid_mode or self.thumbnail_loader is None:
+            return
+        
+        indices = self.grid_page_indices()
+        try:
+            while True:
+                index = self.thumbnail_loader.ready.get_nowait()
+                if index in indices:
+                    self.draw_grid_tile(index - indices.start, index)
+        except queue.Empty:
+            pass
+        
+        self.root.after(50, self.poll_thumbnails)
+    
+    def grid_click(self, event):
+        tile_width = self.canvas.winfo_width() / GRID_COLUMNS
+        tile_height = self.canvas.winfo_height() / GRID_ROWS
+        slot = int(event.y // tile_height) * GRID_COLUMNS + int(event.x // tile_width)
+        
+        indices = self.grid_page_indices()
+        if slot >= len(indices):
+            return
+        
+        index = indices.start + slot
+        if index in self.grid_marked:
+            self.grid_marked.remove(index)
+        else:
+            self.grid_marked.add(index)
+        self.draw_grid_tile(slot, index)
+        self.update_status()
+    
+    def commit_grid_page(self):
+        # Tiles are decided in order up to the first one whose thumbnail is
+        # not on screen yet, so nothing is accepted unseen. The next page
+        # starts at that tile with its mark kept.
+        for index in self.grid_page_indices():
+            key = self.cropped_instances.annotation_id(index)
+            if key not in self.thumbnail_cache:
+                break
+            instance = self.cropped_instances[index]
+            decision = 'reject' if index in self.grid_marked else 'accept'
+            self.record_decision(index, instance['annotation'], decision)
+            self.current_index = index + 1
+        else:
+            key = None
+        
+        self.grid_marked = set(index for index in self.grid_marked if index >= self.current_index)
+        self.show_grid_page()
+        if key in self.thumbnail_loader.failed:
+            self.filename_label.config(text=f"Instance {self.current_index + 1} could not be "
+                                            f"loaded; review it in single view (G)")
+        elif key is not None:
+            self.filename_label.config(text="Waiting for thumbnails to load")
+    
+    def change_grid_page(self, direction):
+        page_size = GRID_COLUMNS * GRID_ROWS
+        new_index = self.current_index + direction * page_size
+        if new_index < 0 or new_index >= len(self.cropped_instances):
+            return
+        self.current_index = new_index
+        self.grid_marked = set()
+        self.show_grid_page()
     
     def accept_instance(self, event=None):
         if self.current_index >= len(self.cropped_instances):
             return
         
-        self.accepted_count += 1
+        if self.grid_mode:
+            self.commit_grid_page()
+            return
+        
+        start = time.perf_counter()
+        instance = self.cropped_instances[self.current_index]
+        self.record_decision(self.current_index, instance['annotation'], 'accept')
         self.next_instance_internal()
+        self.record_paint_latency(start)
     
     def reject_instance(self, event=None):
-        if self.current_index >= len(self.cropped_instances):
+        if self.current_index >= len(self.cropped_instances) or self.grid_mode:
             return
         
+        start = time.perf_counter()
         instance = self.cropped_instances[self.current_index]
-        self.rejected_annotations.append(instance['annotation'])
-        self.rejected_count += 1
+        self.record_decision(self.current_index, instance['annotation'], 'reject')
         self.next_instance_internal()
+        self.record_paint_latency(start)
+    
+    def record_decision(self, index, annotation, decision):
+        # A re-decided instance replaces its earlier decision, so the counts
+        # and the rejected set only ever hold the latest one.
+        previous = self.decided[index]
+        if previous == DECISION_CODES['accept']:
+            self.accepted_count -= 1
+        elif previous == DECISION_CODES['reject']:
+            self.rejected_count -= 1
+            self.rejected_annotations.pop(annotation['id'], None)
+        
+        if decision == 'reject':
+            self.rejected_annotations[annotation['id']] = annotation
+            self.rejected_count += 1
+        else:
+            self.accepted_count += 1
+        self.decided[index] = DECISION_CODES[decision]
+        
+        self.journal.record(index, annotation, decision,
+                            self.accepted_count, self.rejected_count)
+    
+    def toggle_perf_overlay(self, event=None):
+        self.perf_overlay = not self.perf_overlay
+        if self.perf_overlay:
+            self.perf_label.pack(fill=tk.X, padx=10, before=self.instructions_frame)
+            self.update_perf_overlay()
+        else:
+            self.perf_label.pack_forget()
+    
+    def update_perf_overlay(self):
+        if not self.perf_overlay or not self.perf_label.winfo_exists():
+            return
+        
+        parts = [f"{name} {stats['p50_ms']:.1f}/{stats['p95_ms']:.1f}ms"
+                 for name, stats in sorted(perf.summary().items())]
+        parts.append(f"decode cache {self.decode_cache.hit_rate:.0%}")
+        parts.append(f"thumbs {self.thumbnail_cache.hit_rate:.0%}")
+        self.perf_label.config(text="p50/p95  " + " | ".join(parts))
+        
+        self.root.after(500, self.update_perf_overlay)
+    
+    def dump_perf_stats(self, event=None):
+        Path('output').mkdir(exist_ok=True)
+        output_path = Path('output') / f'perf_{time.strftime("%Y%m%d_%H%M%S")}.json'
+        perf.dump(output_path, {
+            'decode_cache': {'hits': self.decode_cache.hits, 'misses': self.decode_cache.misses,
+                             'bytes': self.decode_cache.current_bytes},
+            'thumbnail_cache': {'hits': self.thumbnail_cache.hits,
+                                'misses': self.thumbnail_cache.misses,
+                                'bytes': self.thumbnail_cache.current_bytes},
+            'frame_times_ms': list(self.redraw.frame_times) if self.redraw else []
+        })
+        self.filename_label.config(text=f"Performance stats saved to {output_path}")
+    
+    def record_paint_latency(self, start):
+        # Canvas redraws are idle callbacks queued by the new image, so an
+        # idle callback queued after them fires once the frame is painted.
+        self.root.after_idle(
+            lambda: perf.record('keystroke_to_paint', (time.perf_counter() - start) * 1000)
+        )
     
     def next_instance_internal(self):
         self.current_index += 1
@@ -479,6 +3027,9 @@ class COCOLabelReviewer:
         self.load_current_instance()
     
     def next_instance(self, event=None):
+        if self.grid_mode:
+            self.change_grid_page(1)
+            return
         if self.current_index < len(self.cropped_instances) - 1:
             self.current_index += 1
             self.image_offset_x = 0
@@ -486,6 +3037,9 @@ class COCOLabelReviewer:
             self.load_current_instance()
     
     def prev_instance(self, event=None):
+        if self.grid_mode:
+            self.change_grid_page(-1)
+            return
         if self.current_index > 0:
             self.current_index -= 1
             self.image_offset_x = 0
@@ -494,12 +3048,24 @@ class COCOLabelReviewer:
     
     def update_status(self):
         total = len(self.cropped_instances)
-        self.progress_label.config(
-            text=f"Instance {self.current_index + 1} of {total}"
-        )
+        if self.grid_mode:
+            indices = self.grid_page_indices()
+            self.progress_label.config(
+                text=f"Instances {indices.start + 1}-{indices.stop} of {total}"
+            )
+            self.filename_label.config(text=f"{len(self.grid_marked)} marked")
+        else:
+            self.progress_label.config(
+                text=f"Instance {self.current_index + 1} of {total}"
+            )
+            
+            instance = self.cropped_instances[self.current_index]
+            self.filename_label.config(text=instance_display_name(instance))
         
-        instance = self.cropped_instances[self.current_index]
-        self.filename_label.config(text=instance['path'].name)
+        category = self.category_by_id.get(
+            self.cropped_instances.category_id(self.current_index))
+        if category is not None:
+            self.category_label.config(text=f"Reviewing: {category['name']}")
         
         self.stats_label.config(
             text=f"Accepted: {self.accepted_count} | Rejected: {self.rejected_count}"
@@ -513,46 +3079,235 @@ class COCOLabelReviewer:
         self.root.unbind('<Up>')
         self.root.unbind('<Down>')
         self.root.unbind('<Escape>')
+        self.root.unbind('<g>')
+        self.root.unbind('<o>')
+        self.root.unbind('<F2>')
+        self.root.unbind('<F3>')
+        self.perf_overlay = False
+        
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+        
+        if self.redraw is not None:
+            self.redraw.cancel()
+        
+        if self.thumbnail_loader is not None:
+            self.thumbnail_loader.stop()
+            self.thumbnail_loader = None
+        self.grid_mode = False
+        
+        # Esc stops mid-queue too; only a queue reviewed to the end is marked
+        # finished, so the next session can pick up where this one stopped.
+        if self.journal is not None:
+            self.journal.close(finished=self.journal.next_index >= len(self.cropped_instances))
+            self.journal = None
         
         if self.rejected_annotations:
-            output_json = Path('output') / f'rejected_{self.selected_category["name"]}.json'
-            
-            rejected_data = {
-                'images': [],
-                'annotations': self.rejected_annotations,
-                'categories': [self.selected_category]
-            }
-            
-            image_ids = set(ann['image_id'] for ann in self.rejected_annotations)
-            images_dict = {img['id']: img for img in self.coco_data.get('images', [])}
-            rejected_data['images'] = [images_dict[img_id] for img_id in image_ids 
-                                      if img_id in images_dict]
-            
-            with open(output_json, 'w') as f:
-                json.dump(rejected_data, f, indent=2)
-            
-            result_msg = (f"Review Complete!\n\n"
-                         f"Accepted: {self.accepted_count}\n"
-                         f"Rejected: {self.rejected_count}\n\n"
-                         f"Rejected annotations saved to:\n{output_json}")
-        else:
-            result_msg = (f"Review Complete!\n\n"
-                         f"Accepted: {self.accepted_count}\n"
-                         f"Rejected: {self.rejected_count}\n\n"
-                         f"No annotations were rejected.")
+            # The export runs on its own thread so the window keeps painting;
+            # it is not a daemon, so closing the window still lets it finish.
+            export_queue = queue.Queue()
+            self.export_thread = threading.Thread(
+                target=self.run_export,
+                args=(list(self.rejected_annotations.values()), list(self.selected_categories),
+                      self.export_format.get(), export_queue, self.export_name_suffix())
+            )
+            self.export_thread.start()
+            self.show_page_2()
+            self.root.after(100, self.poll_export, export_queue,
+                            self.accepted_count, self.rejected_count)
+            return
         
+        result_msg = (f"Review Complete!\n\n"
+                     f"Accepted: {self.accepted_count}\n"
+                     f"Rejected: {self.rejected_count}\n\n"
+                     f"No annotations were rejected.")
         messagebox.showinfo("Review Complete", result_msg)
         
         self.show_page_2()
+    
+    def export_name_suffix(self):
+        # Each shard exports under its own name; only the merge writes the
+        # plain rejected_<category> files, so a shard finishing late cannot
+        # overwrite merged results.
+        num_shards, shard_index = self.active_shard
+        if num_shards <= 1:
+            return ''
+        return f'.shard{shard_index + 1}of{num_shards}'
+    
+    def run_export(self, rejected, categories, export_format, export_queue, name_suffix=''):
+        def report(done, total):
+            export_queue.put(('progress', done, total))
+        
+        try:
+            output_paths = write_rejected_sets('output', rejected, categories, self.coco_index,
+                                               export_format, progress_callback=report,
+                                               name_suffix=name_suffix)
+            export_queue.put(('done', output_paths))
+        except Exception as e:
+            export_queue.put(('error', e))
+    
+    def poll_export(self, export_queue, accepted_count, rejected_count):
+        # Keeps polling whatever page is shown; the progress widgets only
+        # exist on the category page.
+        on_page_2 = self.current_page == 2 and self.export_status.winfo_exists()
+        try:
+            while True:
+                message = export_queue.get_nowait()
+                
+                if message[0] == 'progress':
+                    _, done, total = message
+                    if on_page_2:
+                        self.export_status.config(
+                            text=f"Saving rejected annotations... {done}/{total}")
+                        self.export_progress.config(maximum=max(total, 1), value=done)
+                    continue
+                
+                if message[0] == 'done':
+                    saved_msg = "Rejected annotations saved to:\n" + "\n".join(
+                        str(path) for path in message[1])
+                else:
+                    saved_msg = (f"Failed to save rejected annotations:\n{str(message[1])}\n\n"
+                                f"Decisions are kept in the session journal.")
+                
+                if on_page_2:
+                    self.export_status.config(text="")
+                    self.export_progress.pack_forget()
+                messagebox.showinfo("Review Complete",
+                                    f"Review Complete!\n\n"
+                                    f"Accepted: {accepted_count}\n"
+                                    f"Rejected: {rejected_count}\n\n"
+                                    f"{saved_msg}")
+                return
+        except queue.Empty:
+            pass
+        
+        self.root.after(100, self.poll_export, export_queue, accepted_count, rejected_count)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="COCO Label Reviewer")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run crop extraction without starting the GUI")
+    parser.add_argument('--coco', type=Path, help="COCO annotation JSON file")
+    parser.add_argument('--images', type=Path, help="Images directory")
+    parser.add_argument('--categories', nargs='+', metavar='NAME',
+                        help="Category names to process (default: all)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--output', type=Path, default=Path('output'),
+                        help="Output directory (default: output)")
+    parser.add_argument('--format', choices=sorted(CROP_FORMATS), default=None,
+                        dest='crop_format',
+                        help="Crop file format (default: same as source image)")
+    parser.add_argument('--quality', type=int, default=95,
+                        help="JPEG quality for --format jpg (default: 95)")
+    parser.add_argument('--export-format', choices=sorted(EXPORT_FORMATS), default='json',
+                        help="Rejected set format (default: json)")
+    parser.add_argument('--merge-shards', type=Path, metavar='SHARED_DIR',
+                        help="Merge the shard journals in SHARED_DIR into rejected sets")
+    parser.add_argument('--reject-ids', type=Path, metavar='FILE',
+                        help="Export annotation ids listed in FILE (one per line) as a "
+                             "rejected set per category instead of extracting crops")
+    parser.add_argument('--reject-duplicates', type=float, nargs='?', const=DUPLICATE_IOU,
+                        metavar='IOU',
+                        help="Export same-category boxes overlapping an earlier box above "
+                             f"IOU (default: {DUPLICATE_IOU}) as rejected sets under "
+                             "OUTPUT/duplicates instead of extracting crops")
+    
+    args = parser.parse_args(argv)
+    if args.headless and (args.coco is None or
+                          (args.images is None and args.reject_ids is None and
+                           args.reject_duplicates is None and args.merge_shards is None)):
+        parser.error("--headless requires --coco, and --images unless --reject-ids, "
+                     "--reject-duplicates or --merge-shards is given")
+    return args
+
+
+def run_headless(args):
+    if args.merge_shards is not None:
+        # Merging only needs the journals plus the referenced images, so it
+        # does not load the annotation index.
+        args.output.mkdir(parents=True, exist_ok=True)
+        for summary in merge_shard_journals(args.merge_shards, args.coco, args.output,
+                                            args.export_format):
+            print(f"{summary['name']}: {summary['shards_found']}/{summary['num_shards']} shards, "
+                  f"{summary['decisions']} decisions, {summary['rejected']} rejected")
+            for name in summary['unfinished']:
+                print(f"  still in progress: {name}")
+            for path in summary['output_paths']:
+                print(f"  saved to {path}")
+        return 0
+    
+    coco_index = COCOIndex.load(args.coco)
+    
+    categories = coco_index.categories
+    if args.categories:
+        by_name = {cat['name']: cat for cat in coco_index.categories}
+        missing = [name for name in args.categories if name not in by_name]
+        if missing:
+            print(f"Unknown categories: {', '.join(missing)}")
+            return 1
+        categories = [by_name[name] for name in args.categories]
+    
+    args.output.mkdir(parents=True, exist_ok=True)
+    
+    if args.reject_ids is not None:
+        with open(args.reject_ids, 'r') as f:
+            reject_ids = set(int(line) for line in f if line.strip())
+        
+        rejected = []
+        for cat in categories:
+            rejected.extend(ann for ann in coco_index.annotations_for_category(cat['id'])
+                            if ann['id'] in reject_ids)
+        for output_json in write_rejected_sets(args.output, rejected, categories, coco_index,
+                                               args.export_format):
+            print(f"Rejected annotations saved to {output_json}")
+        return 0
+    
+    if args.reject_duplicates is not None:
+        duplicate_index = DuplicateIndex(coco_index, args.reject_duplicates)
+        rejected = duplicate_index.duplicate_annotations([cat['id'] for cat in categories],
+                                                         args.reject_duplicates)
+        print(f"{len(rejected)} duplicate boxes above IoU {args.reject_duplicates}")
+        for output_json in write_rejected_sets(args.output / 'duplicates', rejected, categories,
+                                               coco_index, args.export_format):
+            print(f"Rejected annotations saved to {output_json}")
+        return 0
+    
+    def report(done, total):
+        if done == total or done % 100 == 0:
+            print(f"\r{done}/{total} images", end='', flush=True)
+    
+    instances = extract_categories_crops(coco_index, categories, args.images,
+                                         output_root=args.output,
+                                         workers=args.workers,
+                                         progress_callback=report,
+                                         crop_format=args.crop_format,
+                                         quality=args.quality)
+    print()
+    
+    counts = {}
+    for i in range(len(instances)):
+        category_id = instances.category_id(i)
+        counts[category_id] = counts.get(category_id, 0) + 1
+    for cat in categories:
+        print(f"{cat['name']}: {counts.get(cat['id'], 0)} instances cropped")
+    
+    return 0
 
 
-def main():
+def main(argv=None):
     try:
         from PIL import Image, ImageTk
     except ImportError:
         print("Pillow is required. Install with: pip install Pillow")
         sys.exit(1)
     
+    args = parse_args(argv)
+    if args.headless:
+        sys.exit(run_headless(args))
+    
     root = tk.Tk()
     
     style = ttk.Style()
@@ -0,0 +1,276 @@
+import json
+import random
+
+import pytest
+
+pytest.importorskip('PIL')
+pytest.importorskip('tkinter')
+
+import labelreviewer as lr
+
+
+def make_index(num_images=6, per_image=5, num_categories=3):
+    index = lr.COCOIndex()
+    annotation_id = 1
+    for image_id in range(1, num_images + 1):
+        index.add_image({'id': image_id, 'file_name': f'{image_id}.jpg',
+                         'width': 640, 'height': 480})
+        for k in range(per_image):
+            index.add_annotation({'id': annotation_id, 'image_id': image_id,
+                                  'category_id': 1 + annotation_id % num_categories,
+                                  'bbox': [10.0 * k, 5.0 * k, 40.0, 30.0], 'area': 1200.0})
+            annotation_id += 1
+    index.categories = [{'id': i, 'name': f'c{i}'} for i in range(1, num_categories + 1)]
+    return index
+
+
+def make_instances(index):
+    instances = lr.InstanceStore(index, 'images')
+    for position in range(index.num_annotations):
+        instances.append(position)
+    return instances
+
+
+# Session journal
+
+def test_read_last_record_spans_chunks(tmp_path):
+    journal = lr.SessionJournal(tmp_path / 'session.jsonl')
+    journal.open({'queue': 1})
+    padding = 'x' * 5000
+    for i in range(3):
+        journal.write({'index': i, 'padding': padding})
+    journal.close()
+    
+    last = journal.read_last_record()
+    assert last['index'] == 2
+    assert last['padding'] == padding
+
+
+def test_read_last_record_missing_file(tmp_path):
+    assert lr.SessionJournal(tmp_path / 'missing.jsonl').read_last_record() is None
+
+
+def test_resume_from_high_water_mark(tmp_path):
+    header = {'queue': 1}
+    journal = lr.SessionJournal(tmp_path / 'session.jsonl')
+    journal.open(header)
+    for i in range(5):
+        journal.record(i, {'id': 100 + i}, 'accept', i + 1, 0)
+    # Going back to instance 2 must not move the resume point back.
+    journal.record(2, {'id': 102}, 'reject', 4, 1)
+    journal.close()
+    
+    state = journal.resume_state(header)
+    assert state['next_index'] == 5
+    assert state['index'] == 2
+    assert journal.resume_state({'queue': 2}) is None
+    
+    resumed = lr.SessionJournal(journal.path)
+    resumed.open(header, resume=True)
+    assert resumed.next_index == 5
+    resumed.close()
+
+
+def test_resume_after_torn_last_line(tmp_path):
+    header = {'queue': 1}
+    journal = lr.SessionJournal(tmp_path / 'session.jsonl')
+    journal.open(header)
+    for i in range(3):
+        journal.record(i, {'id': 100 + i, 'padding': 'x' * 3000}, 'accept', i + 1, 0)
+    journal.close()
+    with open(journal.path, 'a') as f:
+        f.write('{"index":3,"next_index":4,"annot')
+    
+    assert journal.resume_state(header)['next_index'] == 3
+    
+    journal.open(header, resume=True)
+    assert journal.next_index == 3
+    journal.record(3, {'id': 103}, 'accept', 4, 0)
+    journal.close()
+    
+    assert journal.resume_state(header)['next_index'] == 4
+    assert sorted(journal.final_decisions()) == [100, 101, 102, 103]
+
+
+def test_rejected_annotations_last_decision_wins(tmp_path):
+    journal = lr.SessionJournal(tmp_path / 'session.jsonl')
+    journal.open({'queue': 1})
+    journal.record(0, {'id': 1}, 'reject', 0, 1)
+    journal.record(1, {'id': 2}, 'reject', 0, 2)
+    journal.record(0, {'id': 1}, 'reject', 0, 2)
+    journal.record(1, {'id': 2}, 'accept', 1, 1)
+    journal.close()
+    
+    assert journal.rejected_annotations() == [{'id': 1}]
+
+
+def test_interrupted_session_is_not_finished(tmp_path):
+    header = {'queue': 1}
+    journal = lr.SessionJournal(tmp_path / 'session.jsonl')
+    journal.open(header)
+    journal.record(0, {'id': 1}, 'accept', 1, 0)
+    journal.close()
+    assert journal.resume_state(header)['next_index'] == 1
+    
+    journal.open(header, resume=True)
+    journal.close(finished=True)
+    assert journal.read_last_record() == {'finished': True}
+    assert journal.resume_state(header) is None
+
+
+def test_starting_over_keeps_previous_journal(tmp_path):
+    header = {'queue': 1}
+    journal = lr.SessionJournal(tmp_path / 'session.jsonl')
+    journal.open(header)
+    journal.record(0, {'id': 1}, 'reject', 0, 1)
+    journal.close()
+    
+    journal.open(header, resume=False)
+    journal.close()
+    
+    backups = [path for path in tmp_path.iterdir() if path.name != 'session.jsonl']
+    assert len(backups) == 1
+    assert lr.SessionJournal(backups[0]).rejected_annotations() == [{'id': 1}]
+    assert list(journal.decisions()) == []
+
+
+# Sharding
+
+def test_select_shard_partitions_queue():
+    instances = make_instances(make_index())
+    num_shards = 3
+    shards = [lr.select_shard(instances, k, num_shards) for k in range(num_shards)]
+    
+    seen = [shard.annotation_id(i) for shard in shards for i in range(len(shard))]
+    assert sorted(seen) == [instances.annotation_id(i) for i in range(len(instances))]
+    assert all(len(shard) for shard in shards)
+    assert lr.select_shard(instances, 0, 1) is instances
+
+
+def test_merge_shard_journals(tmp_path):
+    index = make_index()
+    coco_path = tmp_path / 'coco.json'
+    with open(coco_path, 'w') as f:
+        json.dump({'images': index.images, 'categories': index.categories,
+                   'annotations': [index.get_annotation(position)
+                                   for position in range(index.num_annotations)]}, f)
+    
+    instances = make_instances(index)
+    shared_dir = tmp_path / 'shared'
+    num_shards = 2
+    expected = set()
+    for k in range(num_shards):
+        shard = lr.select_shard(instances, k, num_shards)
+        journal = lr.SessionJournal(lr.shard_journal_path(shared_dir, 'review', k, num_shards))
+        journal.open(lr.SessionJournal.make_header(index.categories, shard))
+        for i in range(len(shard)):
+            annotation = shard[i]['annotation']
+            decision = 'reject' if annotation['id'] % 4 == 0 else 'accept'
+            journal.record(i, annotation, decision, 0, 0)
+            if decision == 'reject':
+                expected.add(annotation['id'])
+        journal.close(finished=k == 0)
+    
+    summaries = lr.merge_shard_journals(shared_dir, coco_path, tmp_path / 'output')
+    assert len(summaries) == 1
+    summary = summaries[0]
+    assert summary['shards_found'] == num_shards
+    assert summary['unfinished'] == ['session_review.shard2of2.jsonl']
+    assert summary['decisions'] == index.num_annotations
+    assert summary['rejected'] == len(expected)
+    
+    merged = set()
+    for path in summary['output_paths']:
+        with open(path) as f:
+            data = json.load(f)
+        merged.update(ann['id'] for ann in data['annotations'])
+        image_ids = set(img['id'] for img in data['images'])
+        assert all(ann['image_id'] in image_ids for ann in data['annotations'])
+    assert merged == expected
+
+
+# RLE masks
+
+def encode_rle_counts(counts):
+    # pycocotools' rleToString.
+    chars = []
+    for i, value in enumerate(counts):
+        if i > 2:
+            value -= counts[i - 2]
+        more = True
+        while more:
+            char = value & 0x1f
+            value >>= 5
+            more = value != -1 if char & 0x10 else value != 0
+            if more:
+                char |= 0x20
+            chars.append(chr(char + 48))
+    return ''.join(chars)
+
+
+def mask_counts(mask, height, width):
+    # Column-major runs starting with background.
+    counts = []
+    current = 0
+    run = 0
+    for col in range(width):
+        for row in range(height):
+            if mask[row][col] != current:
+                counts.append(run)
+                current = mask[row][col]
+                run = 0
+            run += 1
+    counts.append(run)
+    return counts
+
+
+def test_decode_rle_counts_round_trip():
+    rng = random.Random(0)
+    for _ in range(50):
+        counts = [rng.choice([0, 1, 7, 31, 32, 1000, 123456]) for _ in range(rng.randint(1, 20))]
+        assert lr.decode_rle_counts(encode_rle_counts(counts)) == counts
+
+
+def test_rle_mask_rects_cover_mask():
+    rng = random.Random(1)
+    height, width = 23, 17
+    mask = [[1 if rng.random() < 0.4 else 0 for _ in range(width)] for _ in range(height)]
+    counts = mask_counts(mask, height, width)
+    region = (3, 2, 14, 20)
+    
+    for encoded in (counts, encode_rle_counts(counts)):
+        painted = [[0] * width for _ in range(height)]
+        for x1, y1, x2, y2 in lr.rle_mask_rects({'size': [height, width], 'counts': encoded},
+                                                region):
+            for row in range(y1, y2):
+                for col in range(x1, x2):
+                    assert painted[row][col] == 0
+                    painted[row][col] = 1
+        
+        for row in range(height):
+            for col in range(width):
+                inside = region[0] <= col < region[2] and region[1] <= row < region[3]
+                assert painted[row][col] == (mask[row][col] if inside else 0)
+
+
+# Overlaps
+
+def test_overlapping_pairs_matches_brute_force():
+    rng = random.Random(2)
+    boxes = [[rng.uniform(0, 500), rng.uniform(0, 500), rng.uniform(0, 80), rng.uniform(0, 80)]
+             for _ in range(300)]
+    boxes.append([0.0, 0.0, 600.0, 600.0])
+    boxes.append([10.0, 10.0, 0.0, 5.0])
+    
+    for min_iou in (0.0, 0.3):
+        found = {(i, j): iou for i, j, iou in lr.overlapping_pairs(boxes, min_iou)}
+        expected = {}
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                iou = lr.box_iou(boxes[i], boxes[j])
+                if iou > min_iou:
+                    expected[(i, j)] = iou
+        
+        normalized = {(min(i, j), max(i, j)): iou for (i, j), iou in found.items()}
+        assert len(normalized) == len(found)
+        assert normalized == pytest.approx(expected)